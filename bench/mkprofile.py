@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+create a synthetic signal profile for benchmarking, 10000 messages into /tmp/profile:
+bench/mkprofile.py /tmp/profile --messages 10000
+signal-export.py --signal-home /tmp/profile --conversation group-0 --group --format html --out /tmp/out.html
+"""
+
+import sys, os, subprocess, json, argparse, random, secrets, sqlite3, tempfile
+from shutil import which
+
+try:
+    from sqlcipher3 import dbapi2 as sqlcipher_dbapi
+except ImportError:
+    try:
+        from pysqlcipher3 import dbapi2 as sqlcipher_dbapi
+    except ImportError:
+        sqlcipher_dbapi = None
+
+# the columns of signal desktop's tables the exporter (and the indexes) care about
+schema = """
+CREATE TABLE messages(id STRING PRIMARY KEY ASC, json TEXT, unread INTEGER, expires_at INTEGER,
+    sent_at INTEGER, schemaVersion INTEGER, conversationId STRING, received_at INTEGER,
+    source STRING, sourceDevice STRING, hasAttachments INTEGER, hasFileAttachments INTEGER,
+    hasVisualMediaAttachments INTEGER, expireTimer INTEGER, expirationStartTimestamp INTEGER,
+    type STRING, body TEXT);
+CREATE INDEX messages_conversation ON messages (conversationId, received_at);
+CREATE INDEX messages_receipt ON messages (sent_at);
+CREATE TABLE conversations(id STRING PRIMARY KEY ASC, json TEXT, active_at INTEGER,
+    type STRING, members TEXT, name TEXT, profileName TEXT, profileFamilyName TEXT,
+    profileFullName TEXT, e164 TEXT);
+"""
+
+# with --user-version 1360 or later attachments are rows of their own, not part of the JSON
+attachments_schema = """
+CREATE TABLE message_attachments(messageId TEXT NOT NULL, editHistoryIndex INTEGER,
+    attachmentType TEXT NOT NULL, orderInMessage INTEGER NOT NULL, conversationId TEXT NOT NULL,
+    sentAt INTEGER NOT NULL, contentType TEXT NOT NULL, path TEXT, fileName TEXT,
+    size INTEGER NOT NULL, thumbnailPath TEXT,
+    PRIMARY KEY (messageId, editHistoryIndex, attachmentType, orderInMessage));
+"""
+
+bodies = [
+    "ok",
+    "see you later",
+    "did you see this? https://example.com/some/article?id=42",
+    "haha \U0001f602\U0001f602",
+    "<b>not bold</b> & not a tag",
+    "first line\nsecond line\nthird line",
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud "
+    "exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat.",
+]
+
+extensions = {
+    "image/jpeg": "jpg",
+    "video/mp4": "mp4",
+    "audio/aac": "aac",
+    "text/plain": "txt",
+    "application/pdf": "pdf",
+}
+
+
+def parse_mix(spec):
+    """'image/jpeg=6,video/mp4=1' -> ([content types], [weights])"""
+    mix = {}
+    for part in spec.split(","):
+        content_type, _, weight = part.partition("=")
+        mix[content_type.strip()] = float(weight or 1)
+    return list(mix), list(mix.values())
+
+
+class Generator:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.members = [f"+1555{i:07d}" for i in range(args.contacts)]
+        self.att_dir = os.path.join(args.profile, "attachments.noindex")
+        self.content_types, self.weights = parse_mix(args.attachment_mix)
+        self.attachment_bytes = 0
+        self.attachment_files = 0
+        self.attachment_table = args.user_version >= 1360
+        self.attachment_rows = []
+
+    def conversations(self):
+        """(id, type, members, name, profileName, profileFullName, e164) rows"""
+        for i, number in enumerate(self.members):
+            # every other contact has no name of its own, like unsaved numbers
+            name = f"Contact {i}" if i % 2 == 0 else None
+            yield (
+                f"private-{i}",
+                "private",
+                None,
+                name,
+                f"Profile {i}",
+                f"Profile {i} Family",
+                number,
+            )
+        for g in range(self.args.groups):
+            members = self.rng.sample(
+                self.members, min(self.args.group_size, len(self.members))
+            )
+            yield (
+                f"group-{g}",
+                "group",
+                " ".join(members),
+                f"Group {g}",
+                None,
+                None,
+                None,
+            )
+
+    def conversation_weights(self):
+        """group-0 gets half the messages, the rest is spread over everything else"""
+        ids = [f"group-{g}" for g in range(self.args.groups)]
+        ids += [f"private-{i}" for i in range(len(self.members))]
+        rest = 0.5 / max(len(ids) - 1, 1)
+        return ids, [0.5] + [rest] * (len(ids) - 1)
+
+    def attachment(self, n):
+        content_type = self.rng.choices(self.content_types, self.weights)[0]
+        ext = extensions.get(content_type, "bin")
+        subpath = f"{n % 256:02x}/{n:08d}"
+        size = max(1, int(self.rng.expovariate(1 / self.args.attachment_size)))
+        size = self.write(subpath, size, text=content_type.startswith("text"))
+        att = {
+            "contentType": content_type,
+            "fileName": f"file-{n}.{ext}",
+            "path": subpath,
+            "size": size,
+        }
+        if content_type.startswith("image") or content_type.startswith("video"):
+            self.write(subpath + "-thumb", min(size, 2048))
+            att["thumbnail"] = {"contentType": "image/png", "path": subpath + "-thumb"}
+        return att
+
+    def write(self, subpath, size, text=False):
+        path = os.path.join(self.att_dir, subpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if text:
+            data = "\n".join(bodies)
+            data = (data * (size // len(data) + 1))[:size].encode("utf-8")
+        else:
+            data = self.rng.randbytes(size)
+        with open(path, "wb") as fh:
+            fh.write(data)
+        self.attachment_bytes += len(data)
+        self.attachment_files += 1
+        return len(data)
+
+    def messages(self):
+        """messages table rows, in sent_at order"""
+        args = self.args
+        ids, weights = self.conversation_weights()
+        recent = {cid: [] for cid in ids}  # last few (sent_at, author) per conversation
+        self.counts = dict.fromkeys(ids, 0)
+        sent_at = 1546300800000  # 2019-01-01
+        for n in range(args.messages):
+            sent_at += self.rng.randint(1000, 600000)
+            cid = self.rng.choices(ids, weights)[0]
+            self.counts[cid] += 1
+            source = self.rng.choice(self.members)
+            msg_type = self.rng.choice(("incoming", "incoming", "outgoing"))
+            data = {
+                "id": f"msg-{n:08d}",
+                "conversationId": cid,
+                "type": msg_type,
+                "sent_at": sent_at,
+                "received_at": sent_at + 500,
+                "attachments": [],
+            }
+            if msg_type == "incoming":
+                data["source"] = source
+            roll = self.rng.random()
+            if roll < args.system_ratio / 2:
+                data["type"] = "keychange"
+                data.pop("source", None)
+            elif roll < args.system_ratio:
+                data["expirationTimerUpdate"] = {"expireTimer": 3600, "source": source}
+            else:
+                data["body"] = self.rng.choice(bodies)
+                if self.rng.random() < args.attachment_ratio:
+                    data["attachments"] = [
+                        self.attachment(n * 4 + i)
+                        for i in range(self.rng.choice((1, 1, 1, 2, 4)))
+                    ]
+                if recent[cid] and self.rng.random() < args.quote_ratio:
+                    quoted_at, author = self.rng.choice(recent[cid])
+                    data["quote"] = {
+                        "id": quoted_at,
+                        "author": author,
+                        "text": self.rng.choice(bodies),
+                        "attachments": [],
+                    }
+                recent[cid] = (recent[cid] + [(sent_at, source)])[-20:]
+            attachments = data["attachments"]
+            if self.attachment_table:
+                for i, att in enumerate(data.pop("attachments")):
+                    thumbnail = att.get("thumbnail", {}).get("path")
+                    self.attachment_rows.append(
+                        (data["id"], "attachment", i, cid, sent_at)
+                        + (att["contentType"], att["path"], att["fileName"])
+                        + (att["size"], thumbnail)
+                    )
+            yield (
+                data["id"],
+                json.dumps(data),
+                sent_at,
+                cid,
+                sent_at + 500,
+                data.get("source"),
+                int(bool(attachments)),
+                int(any(not a["contentType"].startswith("image") for a in attachments)),
+                int(any(a["contentType"].startswith("image") for a in attachments)),
+                data["type"],
+                data.get("body"),
+            )
+
+    def build(self, path):
+        conn = sqlite3.connect(path)
+        conn.executescript(schema)
+        conn.executemany(
+            "insert into conversations(id, type, members, name, profileName, profileFullName, e164) "
+            "values (?, ?, ?, ?, ?, ?, ?)",
+            self.conversations(),
+        )
+        conn.executemany(
+            "insert into messages(id, json, sent_at, conversationId, received_at, source, "
+            "hasAttachments, hasFileAttachments, hasVisualMediaAttachments, type, body) "
+            "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self.messages(),
+        )
+        if self.attachment_table:
+            conn.executescript(attachments_schema)
+            conn.executemany(
+                "insert into message_attachments(messageId, attachmentType, orderInMessage, "
+                "conversationId, sentAt, contentType, path, fileName, size, thumbnailPath) "
+                "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self.attachment_rows,
+            )
+        conn.execute(f"pragma user_version = {self.args.user_version}")
+        conn.commit()
+        conn.close()
+
+
+def encrypt(plain, db, key):
+    """write an encrypted copy of the sqlite database `plain` to `db`"""
+    script = (
+        f"ATTACH DATABASE '{db}' AS encrypted KEY \"x'{key}'\";\n"
+        "SELECT sqlcipher_export('encrypted');\n"
+        "DETACH DATABASE encrypted;\n"
+    )
+    if sqlcipher_dbapi is not None:
+        conn = sqlcipher_dbapi.connect(plain)
+        conn.executescript(script)
+        conn.close()
+        return
+    subprocess.run(
+        ["sqlcipher", "-bail", plain],
+        input=script,
+        text=True,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="create a synthetic signal profile (config.json, encrypted sql/db.sqlite, attachments.noindex)"
+    )
+    parser.add_argument("profile", help="directory to create, used as --signal-home")
+    parser.add_argument(
+        "--messages",
+        type=int,
+        default=10000,
+        help="number of messages (default: 10000)",
+    )
+    parser.add_argument(
+        "--contacts",
+        type=int,
+        default=50,
+        help="number of private conversations (default: 50)",
+    )
+    parser.add_argument(
+        "--groups",
+        type=int,
+        default=5,
+        help="number of groups; group-0 gets half of all messages (default: 5)",
+    )
+    parser.add_argument(
+        "--group-size", type=int, default=20, help="members per group (default: 20)"
+    )
+    parser.add_argument(
+        "--quote-ratio",
+        type=float,
+        default=0.1,
+        help="share of messages quoting an earlier one (default: 0.1)",
+    )
+    parser.add_argument(
+        "--system-ratio",
+        type=float,
+        default=0.02,
+        help="share of key changes and timer updates (default: 0.02)",
+    )
+    parser.add_argument(
+        "--attachment-ratio",
+        type=float,
+        default=0.05,
+        help="share of messages with attachments (default: 0.05)",
+    )
+    parser.add_argument(
+        "--attachment-mix",
+        default="image/jpeg=6,video/mp4=1,audio/aac=1,text/plain=1,application/pdf=1",
+        help="content types of attachments and their weights (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--attachment-size",
+        type=int,
+        default=4096,
+        help="mean attachment size in bytes (default: 4096)",
+    )
+    parser.add_argument(
+        "--user-version",
+        type=int,
+        default=0,
+        help="schema version to claim; 8 or later makes the exporter read the native "
+        "columns, 1360 or later puts attachments into their own table (default: 0)",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="random seed (default: 1)")
+    args = parser.parse_args()
+
+    if sqlcipher_dbapi is None and which("sqlcipher") is None:
+        raise SystemExit(
+            "need sqlcipher3, pysqlcipher3 or the sqlcipher binary to encrypt"
+        )
+    if os.path.exists(args.profile):
+        raise SystemExit(f"{args.profile} exists, refusing to overwrite it")
+
+    key = secrets.token_hex(32)
+    os.makedirs(os.path.join(args.profile, "sql"))
+    with open(os.path.join(args.profile, "config.json"), "w") as fh:
+        json.dump({"key": key}, fh)
+
+    generator = Generator(args)
+    with tempfile.TemporaryDirectory(dir=args.profile) as tmp:
+        plain = os.path.join(tmp, "plain.sqlite")
+        generator.build(plain)
+        encrypt(plain, os.path.join(args.profile, "sql", "db.sqlite"), key)
+    with open(os.path.join(args.profile, "profile.json"), "w") as fh:
+        json.dump({"args": vars(args), "messages": generator.counts}, fh, indent=2)
+    print(
+        f"{args.profile}: {args.messages} messages, {generator.attachment_files} attachment "
+        f"files ({generator.attachment_bytes / 1e6:.1f} MB)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+time signal-export.py on synthetic profiles of 10k, 100k and 1M messages:
+bench/run.py --work-dir /tmp/signal-bench
+compare against an earlier run:
+bench/run.py --work-dir /tmp/signal-bench --save after.json --baseline before.json
+"""
+
+import sys, os, subprocess, json, argparse, statistics, time
+
+here = os.path.dirname(os.path.abspath(__file__))
+exporter = os.path.join(os.path.dirname(here), "signal-export.py")
+
+
+def ensure_profile(work_dir, messages, extra):
+    """generate the profile for `messages` once, later runs reuse it"""
+    profile = os.path.join(work_dir, f"profile-{messages}")
+    if not os.path.exists(os.path.join(profile, "sql", "db.sqlite")):
+        cmd = [sys.executable, os.path.join(here, "mkprofile.py"), profile]
+        subprocess.run(cmd + ["--messages", str(messages)] + extra, check=True)
+    return profile
+
+
+def time_export(profile, fmt, out, repeat, extra):
+    """wall clock seconds of `repeat` exports of group-0, the biggest conversation"""
+    cmd = [sys.executable, exporter, "--signal-home", profile]
+    cmd += ["--conversation", "group-0", "--group", "--format", fmt, "--out", out]
+    timings = []
+    for _ in range(repeat):
+        started = time.monotonic()
+        subprocess.run(cmd + extra, check=True, stderr=subprocess.DEVNULL)
+        timings.append(time.monotonic() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="time text and html exports of synthetic profiles",
+        epilog="arguments after -- are passed on to signal-export.py",
+    )
+    parser.add_argument(
+        "--work-dir",
+        required=True,
+        help="profiles and exports go here; profiles are kept for the next run",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000,1000000",
+        help="comma separated message counts (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--formats",
+        default="text,html",
+        help="comma separated formats (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per size and format (default: 3)"
+    )
+    parser.add_argument(
+        "--profile-args",
+        default="",
+        help="extra mkprofile.py arguments, like '--quote-ratio 0.5'; only used when a profile is created",
+    )
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument(
+        "--baseline", help="JSON file of an earlier --save to compare with"
+    )
+    args, extra = parser.parse_known_args()
+    if extra[:1] == ["--"]:
+        extra = extra[1:]
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = {(r["messages"], r["format"]): r for r in json.load(fh)}
+
+    results = []
+    for messages in (int(size) for size in args.sizes.split(",")):
+        profile = ensure_profile(args.work_dir, messages, args.profile_args.split())
+        for fmt in args.formats.split(","):
+            out = os.path.join(args.work_dir, f"export-{messages}.{fmt}")
+            timings = time_export(profile, fmt, out, args.repeat, extra)
+            with open(os.path.join(profile, "profile.json")) as fh:
+                exported = json.load(fh)["messages"]["group-0"]
+            result = {
+                "messages": messages,
+                "exported": exported,
+                "format": fmt,
+                "best": min(timings),
+                "median": statistics.median(timings),
+                "bytes": os.path.getsize(out),
+            }
+            results.append(result)
+            line = (
+                f"{messages:>8} {fmt:<5} best {result['best']:8.2f} s  "
+                f"median {result['median']:8.2f} s  {exported / result['best']:>9.0f} msg/s"
+            )
+            before = baseline.get((messages, fmt))
+            if before:
+                change = (result["best"] - before["best"]) / before["best"] * 100
+                line += f"  {change:+6.1f}% vs baseline"
+            print(line, flush=True)
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
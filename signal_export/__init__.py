@@ -0,0 +1,29 @@
+"""
+export signal messages to HTML or plain text; signal-export.py is the command line,
+this package the library underneath:
+
+    from signal_export import open_profile
+    with open_profile() as profile:
+        for message in profile.iter_messages(conversation_id, start="2019-01-01"):
+            print(message.sent_at, profile.name(message.source), message.body)
+
+Submodules are imported on first use, `import signal_export` itself is cheap.
+"""
+
+import importlib
+
+_exports = {
+    "open_profile": "profile",
+    "Profile": "profile",
+    "Message": "model",
+    "Quote": "model",
+    "Attachment": "model",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_exports[name]}", __name__), name)
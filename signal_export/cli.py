@@ -0,0 +1,515 @@
+"""the command line interface, signal-export.py runs main"""
+
+import sys, os, json, argparse
+
+from .db import DBI
+from .paths import SignalPaths, CustomPaths
+from .query import build_where, build_query
+from .util import justify1, to_ymd
+
+
+def print_conversation_stats(rows, output):
+    """--stats-conversations, as a table or as JSON"""
+    columns = (
+        "id",
+        "type",
+        "name",
+        "messages",
+        "first",
+        "last",
+        "attachments",
+        "bytes",
+    )
+    if output == "json":
+        json.dump([dict(zip(columns, row)) for row in rows], sys.stdout, indent=2)
+        print()
+        return
+    lines = [
+        (
+            "conversation",
+            "type     messages  first       last        attachments        MB",
+        )
+    ]
+    for cid, ctype, name, messages, first, last, attachments, size in rows:
+        lines.append(
+            (
+                f"{name} ({cid})",
+                f"{ctype or '?':<8} {messages:>8}  {to_ymd(first)[:10]}  {to_ymd(last)[:10]}"
+                f"  {attachments:>11}  {size / 1e6:>8.1f}",
+            )
+        )
+    print("\n".join(justify1(lines)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--conversation", action="store", help="group name or contact number"
+    )
+    parser.add_argument(
+        "--group",
+        action="store_true",
+        help="specify that the referenced conversation is a group (default: no); affects formatting of user names",
+    )
+    parser.add_argument(
+        "--list-groups",
+        action="store_true",
+        help="do not extract a log, list all available groups instead",
+    )
+    parser.add_argument(
+        "--list-ids",
+        action="store_true",
+        help="do not extract a log, list all available IDs of conversations with individuals instead",
+    )
+    parser.add_argument(
+        "--stats-conversations",
+        action="store",
+        nargs="?",
+        const="table",
+        choices=("table", "json"),
+        help="do not extract a log, list message count, first and last message, number and size of attachments per conversation, as a table (default) or JSON. Honors --start-at, --end-at and --include-system-messages",
+    )
+    parser.add_argument(
+        "--all-conversations",
+        action="store_true",
+        help="export every conversation that has messages into --out-dir, one file per conversation",
+    )
+    parser.add_argument(
+        "--out-dir",
+        action="store",
+        default=None,
+        help="directory for --all-conversations",
+    )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes exporting conversations in parallel with --all-conversations (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        help="number of processes decoding and rendering messages of a single export; the output is the same as with one (default: 1)",
+    )
+    parser.add_argument(
+        "--start-at",
+        action="store",
+        help="conversation window start date + optional time. Format YYYY-MM-DD or YYYY-MM-DD hh:mm; included (starting exactly at supplied instant)",
+    )
+    parser.add_argument(
+        "--end-at",
+        action="store",
+        help="conversation window end date + optional time. Format YYYY-MM-DD or YYYY-MM-DD hh:mm; excluded (ending right before supplied instant)",
+    )
+    parser.add_argument(
+        "--include-system-messages",
+        action="store_true",
+        help="also export timer updates, key changes and other messages without a body (default: skipped)",
+    )
+    parser.add_argument(
+        "--format",
+        action="store",
+        default="text",
+        help="output format ('text' or 'html', default: text)",
+    )
+    parser.add_argument(
+        "--out",
+        action="store",
+        default=None,
+        help="file name to write to (default: standard output)",
+    )
+    parser.add_argument(
+        "--split-by",
+        action="store",
+        default=None,
+        help="write one file per month, week, year or N-messages in a single pass; --out is then a strftime pattern like %%Y-%%m.html, %%N is replaced by the part number",
+    )
+    parser.add_argument(
+        "--page-size",
+        action="store",
+        type=int,
+        default=None,
+        help="html only: write pages of this many messages plus an index page at --out",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store",
+        default=None,
+        metavar="STATEFILE",
+        help="remember the last exported message per output file and conversation in STATEFILE, and only append newer messages to an existing export",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted export to --out from its last checkpoint (OUT.checkpoint, saved every 5000 messages), dropping whatever was written after it",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="after the export, keep watching the database and append new messages of --conversation as they arrive, until interrupted. Reads the database itself, not the --cache-dir snapshot",
+    )
+    parser.add_argument(
+        "--signal-home",
+        action="store",
+        default=None,
+        help="path to the signal data files (default: OS specific)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        action="store",
+        default=None,
+        help="keep a decrypted, indexed snapshot of the database here and reuse it while db.sqlite is unchanged. The snapshot is NOT encrypted, see README",
+    )
+    parser.add_argument(
+        "--link-mode",
+        action="store",
+        default="copy",
+        choices=("copy", "hardlink", "symlink", "reflink"),
+        help="how attachments get into the export's attachments directory; hardlink and reflink fall back to copying where the filesystem can't (default: copy)",
+    )
+    parser.add_argument(
+        "--mirror-check",
+        action="store",
+        default="stat",
+        choices=("stat", "hash"),
+        help="how an already mirrored attachment is recognized as unchanged: same size and mtime, or same content (default: stat)",
+    )
+    parser.add_argument(
+        "--copy-workers",
+        action="store",
+        type=int,
+        default=4,
+        help="number of threads mirroring attachments while the export is rendered; 0 copies inline (default: 4)",
+    )
+    parser.add_argument(
+        "--thumbnails",
+        action="store",
+        default=None,
+        choices=("webp", "jpeg"),
+        help="show downscaled previews of images in html exports, linking to the originals. Needs Pillow",
+    )
+    parser.add_argument(
+        "--thumbnail-size",
+        action="store",
+        type=int,
+        default=480,
+        help="longest side of a preview in pixels (default: 480)",
+    )
+    parser.add_argument(
+        "--thumbnail-workers",
+        action="store",
+        type=int,
+        default=None,
+        help="number of processes making previews (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--inline-text-limit",
+        action="store",
+        type=int,
+        default=65536,
+        metavar="BYTES",
+        help="html only: show text attachments up to this size in the page, longer ones are cut off with a link to the file (default: 65536)",
+    )
+    parser.add_argument(
+        "--index",
+        action="store",
+        default=None,
+        metavar="FILE",
+        help="full text search index for --update-index and --search. NOT encrypted, see README",
+    )
+    parser.add_argument(
+        "--update-index",
+        action="store_true",
+        help="add messages sent since the last update to --index, creating it if needed",
+    )
+    parser.add_argument(
+        "--search",
+        action="store",
+        default=None,
+        metavar="QUERY",
+        help="do not extract a log, show the messages matching QUERY (SQLite FTS5 syntax) in --index with some context; --conversation narrows it to one conversation",
+    )
+    parser.add_argument(
+        "--context",
+        action="store",
+        type=int,
+        default=2,
+        help="messages shown before and after each --search match (default: 2)",
+    )
+    parser.add_argument(
+        "--search-limit",
+        action="store",
+        type=int,
+        default=50,
+        help="show at most this many --search matches, best first (default: 50)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print wall time and calls per stage, rows, name lookups, bytes written and attachments copied to stderr",
+    )
+    parser.add_argument(
+        "--stats-json",
+        action="store",
+        default=None,
+        metavar="FILE",
+        help="write the --stats numbers to FILE as JSON",
+    )
+    parser.add_argument(
+        "--stats-prom",
+        action="store",
+        default=None,
+        metavar="FILE",
+        help="write the --stats numbers to FILE in the Prometheus textfile format",
+    )
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="do not extract a log, print the query plan of the export query instead",
+    )
+    args = parser.parse_args()
+
+    if args.signal_home:
+        paths = CustomPaths(base=args.signal_home)
+    else:
+        paths = SignalPaths.default()
+
+    if args.list_groups or args.list_ids or args.stats_conversations:
+        # no output file, no handler: the rest of the exporter isn't even imported
+        dbi = DBI(paths, compact_lookup=not args.group, cache_dir=args.cache_dir)
+        try:
+            listing(args, dbi)
+        finally:
+            dbi.close()
+        return
+
+    if args.explain:
+        # before any output is opened, --explain must not touch an existing export
+        dbi = DBI(paths, compact_lookup=not args.group, cache_dir=args.cache_dir)
+        try:
+            explain(args, parser, dbi)
+        finally:
+            dbi.close()
+        return
+
+    from .output import open_export, HighWaterMarks, Checkpoint, Rotation, Pagination
+    from .render import handlers
+    from .stats import Stats, CountingWriter, wants_stats, report_stats
+
+    if args.format not in handlers:
+        raise SystemExit("unknown output format")
+
+    if args.all_conversations:
+        if not args.out_dir:
+            raise SystemExit("--all-conversations needs --out-dir")
+        if args.split_by:
+            raise SystemExit("--all-conversations can't be combined with --split-by")
+        if args.thumbnails:
+            raise SystemExit("--all-conversations can't be combined with --thumbnails")
+        if args.jobs > 1:
+            raise SystemExit("--all-conversations runs --workers processes, not --jobs")
+        if args.resume or args.follow:
+            raise SystemExit(
+                "--all-conversations can't be combined with --resume or --follow"
+            )
+        from .workers import export_all
+
+        export_all(args, paths)
+        return
+
+    marks = HighWaterMarks(args.incremental) if args.incremental else None
+    rotation = None
+    checkpoint = None
+    appending = False
+    stats = Stats() if wants_stats(args) else None
+    outputs = []
+    if args.jobs > 1 and (args.page_size or args.thumbnails):
+        raise SystemExit("--jobs can't be combined with --page-size or --thumbnails")
+    if args.follow and (args.split_by or args.page_size):
+        raise SystemExit(
+            "--follow appends to a single file, not --split-by or --page-size"
+        )
+    if args.follow and args.format == "html" and args.out is None:
+        raise SystemExit("--follow needs --out for html")
+    if args.thumbnails:
+        from .thumbnails import Thumbnailer, Image
+
+        if Image is None:
+            raise SystemExit("--thumbnails needs Pillow: pip install Pillow")
+    if args.out is None:
+        if args.split_by or args.page_size or args.thumbnails:
+            raise SystemExit("--split-by, --page-size and --thumbnails need --out")
+        if marks or args.resume:
+            raise SystemExit("--incremental and --resume need --out")
+        out = CountingWriter(sys.stdout) if stats else sys.stdout
+    else:
+        from .mirror import AttachmentMirror
+
+        if args.resume and (args.page_size or args.split_by):
+            raise SystemExit(
+                "--resume can't continue --split-by or --page-size exports"
+            )
+        if args.page_size:
+            if args.format != "html" or args.split_by or marks:
+                raise SystemExit(
+                    "--page-size only works for html, without --split-by and --incremental"
+                )
+            rotation = Pagination(args.out, args.page_size)
+            out = None  # opened page by page
+        elif args.split_by:
+            split_by = Rotation.parse_split_by(args.split_by)
+            if marks and isinstance(split_by, int):
+                raise SystemExit("--incremental can't continue --split-by N-messages")
+            rotation = Rotation(args.out, split_by, append=marks is not None)
+            out = None  # opened by the rotation
+        else:
+            checkpoint = Checkpoint(args.out, args.conversation)
+            if args.resume:
+                out, appending = checkpoint.resume(), True
+            else:
+                mark = marks.get(args.out, args.conversation) if marks else None
+                out, appending = open_export(
+                    args.out, handlers[args.format].footer, mark is not None
+                )
+                checkpoint.out = out
+            outputs.append((args.out, out.tell()))
+        out_dir = os.path.dirname(args.out) or "."
+        paths.mirror = AttachmentMirror(
+            os.path.join(out_dir, "attachments"),
+            link_mode=args.link_mode,
+            check=args.mirror_check,
+            workers=args.copy_workers,
+            link_dir=out_dir,
+        )
+        if checkpoint is not None:
+            checkpoint.mirror = paths.mirror
+        if args.thumbnails:
+            paths.thumbnails = Thumbnailer(
+                os.path.join(out_dir, "attachments", "thumbnails"),
+                image_format=args.thumbnails,
+                size=args.thumbnail_size,
+                workers=args.thumbnail_workers,
+                link_dir=out_dir,
+            )
+
+    handler = handlers[args.format](paths, out)
+    handler.inline_text_limit = args.inline_text_limit
+
+    dbi = DBI(paths, compact_lookup=not args.group, cache_dir=args.cache_dir)
+    if stats:
+        stats.instrument(dbi, paths)
+        stats.instrument_handler(handler)
+    try:
+        run(args, parser, dbi, handler, rotation, marks, appending, checkpoint)
+    finally:
+        dbi.close()
+        if paths.mirror:
+            paths.mirror.finish()
+        if paths.thumbnails:
+            paths.thumbnails.finish()
+
+    if stats:
+        stats.count("rows_rendered", handler.written)
+        if isinstance(out, CountingWriter):
+            stats.count("bytes_written", out.written)
+        else:
+            if out is not None:
+                out.flush()
+            stats.count_output(rotation.outputs if rotation else outputs)
+        if paths.mirror:
+            stats.count_mirror(paths.mirror)
+        report_stats(args, stats)
+
+
+def listing(args, dbi):
+    """--list-groups, --list-ids and --stats-conversations"""
+    if args.list_groups:
+        dbi.list_groups()
+    elif args.list_ids:
+        dbi.list_ids()
+    else:
+        rows = dbi.conversation_stats(build_where(args))
+        print_conversation_stats(rows, args.stats_conversations)
+
+
+def explain(args, parser, dbi):
+    """--explain: the plan of the query an export with these options would run"""
+    from .output import HighWaterMarks, Checkpoint
+
+    if not args.conversation:
+        parser.print_help()
+        raise SystemExit
+    mark = None
+    if args.resume and args.out:
+        mark = tuple(Checkpoint(args.out, args.conversation).load()["cursor"])
+    elif args.incremental and args.out and (args.split_by or os.path.exists(args.out)):
+        mark = HighWaterMarks(args.incremental).get(args.out, args.conversation)
+    query = build_query(args, args.conversation, mark)
+    print("\n".join(dbi.explain(query)))
+
+
+def search(args, dbi, handler):
+    from .index import SearchIndex
+    from .model import Message
+
+    index = SearchIndex(args.index)
+    try:
+        if args.update_index:
+            added = index.update(dbi)
+            print(f"{args.index}: {added} messages added", file=sys.stderr)
+        if not args.search:
+            return
+        windows = index.search(
+            args.search, args.conversation, args.search_limit, args.context
+        )
+        handler.begin()
+        handler.add_info(f"search: {args.search}")
+        for conversation_id, rows in windows:
+            handler.section(
+                f"{index.directory.get(conversation_id)} ({conversation_id})"
+            )
+            for message_id, sent_at, item in rows:
+                handler.eat(Message.decode(message_id, sent_at, item), index.lookup)
+        handler.end()
+    finally:
+        index.close()
+
+
+def run(args, parser, dbi, handler, rotation, marks, appending, checkpoint):
+    if args.update_index or args.search:
+        if not args.index:
+            raise SystemExit("--update-index and --search need --index")
+        if rotation is not None or appending:
+            raise SystemExit(
+                "--search can't be combined with --split-by, --page-size or --incremental"
+            )
+        search(args, dbi, handler)
+        return
+    conversation_id = args.conversation
+
+    if not conversation_id:
+        parser.print_help()
+        raise SystemExit
+
+    mark = marks.get(args.out, conversation_id) if marks else None
+    if not (appending or rotation is not None):
+        mark = None  # nothing to continue, export everything
+    if checkpoint is not None and checkpoint.cursor:
+        mark = checkpoint.cursor  # --resume
+    query = build_query(args, conversation_id, mark)
+    last = dbi.process_with_handler(
+        query, handler, rotation, appending, args.jobs, checkpoint
+    )
+    if checkpoint is not None:
+        last = last or checkpoint.cursor
+        checkpoint.remove()
+    if marks and last:
+        marks.set(args.out, conversation_id, last)
+        marks.save()
+    if args.follow:
+        from .follow import follow
+
+        follow(args, dbi, handler, last, marks)
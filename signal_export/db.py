@@ -0,0 +1,746 @@
+"""reading the encrypted database: sessions, schema adapters, the snapshot cache"""
+
+import os, json, collections, tempfile
+import sqlite3
+
+from .model import Message, json_loads
+from .query import IsNot, SkipSystemMessages, SqlString, render_query_plan
+
+try:
+    from sqlcipher3 import dbapi2 as sqlcipher_dbapi
+except ImportError:
+    try:
+        from pysqlcipher3 import dbapi2 as sqlcipher_dbapi
+    except ImportError:
+        sqlcipher_dbapi = None
+
+
+class BindingSession:
+    """in-process SQLCipher connection, opened and keyed once"""
+
+    def __init__(self, db, key):
+        self.conn = sqlcipher_dbapi.connect(db)
+        self.conn.execute(f"PRAGMA key = \"x'{key}'\"")
+        self.closed = False
+
+    def iterate(self, sql):
+        yield from self.conn.execute(sql)
+
+    def close(self):
+        self.conn.close()
+        self.closed = True
+
+
+def json_row(pairs):
+    return tuple(value for _, value in pairs)
+
+
+class ProcessSession:
+    """one long-lived sqlcipher child process, fed queries over a pipe
+
+    Results come back in the shell's JSON mode (sqlcipher 4.4.1 / SQLite 3.33 or newer),
+    one row object per line, which keeps types, newlines and "|" intact."""
+
+    end_marker = "--signal-export-end-of-result--"
+
+    def __init__(self, db, key):
+        import subprocess
+
+        self.cmd = ["sqlcipher", "-bail", db]
+        self.proc = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+        )
+        self.closed = False
+        # plain rows for EXPLAIN QUERY PLAN too, instead of the shell's own tree rendering
+        self.proc.stdin.write(".explain off\n.mode json\n")
+        self.discard(f"PRAGMA key = \"x'{key}'\"")  # the "ok", in whatever shape
+
+    def discard(self, sql):
+        """run `sql` and skip its output without parsing it"""
+        self.proc.stdin.write(f"{sql};\n.print {self.end_marker}\n")
+        self.proc.stdin.flush()
+        for line in self.proc.stdout:
+            if line.rstrip("\n") == self.end_marker:
+                return
+        import subprocess
+
+        self.closed = True
+        raise subprocess.CalledProcessError(
+            self.proc.wait(), self.cmd, None, self.proc.stderr.read()
+        )
+
+    def iterate(self, sql):
+        # the trailing ";" terminates the statement, so the shell will not swallow the marker as SQL
+        self.proc.stdin.write(f"{sql};\n.print {self.end_marker}\n")
+        self.proc.stdin.flush()
+        finished = False
+        try:
+            for line in self.proc.stdout:
+                line = line.rstrip("\n")
+                if line == self.end_marker:
+                    finished = True
+                    return
+                if line.startswith("["):
+                    line = line[1:]
+                # each row ends in "," or, the last one, in "]"
+                yield json.loads(line[:-1], object_pairs_hook=json_row)
+            # -bail: the child exits on the first error
+            import subprocess
+
+            self.closed = True
+            raise subprocess.CalledProcessError(
+                self.proc.wait(), self.cmd, None, self.proc.stderr.read()
+            )
+        finally:
+            if not finished and not self.closed:
+                # the consumer stopped early, skip the rest so the next query starts clean
+                for line in self.proc.stdout:
+                    if line.rstrip("\n") == self.end_marker:
+                        break
+
+    def close(self):
+        if not self.closed:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.closed = True
+
+
+class SnapshotSession(BindingSession):
+    """read-only connection to a decrypted Snapshot"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        self.closed = False
+
+
+def open_session(db, key):
+    if sqlcipher_dbapi is not None:
+        return BindingSession(db, key)
+    try:
+        return ProcessSession(db, key)
+    except FileNotFoundError:
+        raise SystemExit(
+            "required dependency not found: sqlcipher (binary or sqlcipher3/pysqlcipher3 module)"
+        )
+
+
+class JsonSchema:
+    """messages as the oldest databases have them: everything is read from messages.json
+
+    A schema adapter picks the columns of the export query and turns its rows into
+    Messages; detect_schema chooses the newest one the database fits."""
+
+    min_version = 0
+    # what the adapter reads, all of it is copied into a Snapshot
+    tables = {"messages": ("id", "conversationId", "sent_at", "json")}
+    columns = "messages.id, messages.sent_at, messages.json"
+    skip_system_messages = None  # SkipSystemMessages reads messages.json
+
+    def __init__(self, version):
+        self.version = version
+
+    @classmethod
+    def fits(cls, version, tables):
+        return version >= cls.min_version and all(
+            set(columns) <= tables.get(table, set())
+            for table, columns in cls.tables.items()
+        )
+
+    def prepare(self, query):
+        query.columns = self.columns
+        self.prepare_where(query.where)
+        return query
+
+    def prepare_where(self, where):
+        """put this schema's SQL into the system message filter of `where`"""
+        if self.skip_system_messages is None:
+            return where
+        for condition in where.conditions:
+            if isinstance(condition, SkipSystemMessages):
+                condition.conditions = list(self.skip_system_messages)
+        return where
+
+    def rows(self, dbi, query):
+        return dbi.iterate(self.prepare(query))
+
+    def decode(self, row):
+        """the Message of a row, None for rows without one"""
+        message_id, sent_at, raw = row
+        if not raw:
+            return None
+        return Message.decode(message_id, sent_at, raw)
+
+    def attachment_totals(self):
+        """SQL for the number and bytes of the attachments of a message"""
+        return (
+            "json_array_length(messages.json, '$.attachments')",
+            "(select sum(json_extract(value, '$.size')) "
+            "from json_each(messages.json, '$.attachments'))",
+        )
+
+
+class ColumnSchema(JsonSchema):
+    """type, source and body have columns of their own since the first search index,
+    JSON is only parsed for quotes and for messages that have attachments"""
+
+    min_version = 8
+    tables = {
+        "messages": JsonSchema.tables["messages"]
+        + ("type", "source", "body", "hasAttachments")
+    }
+    # source is declared STRING, which has numeric affinity: "+49..." is stored as a number
+    source = (
+        "case typeof(messages.source) when 'integer' then '+' || messages.source "
+        "else messages.source end"
+    )
+    # a plain substring search first, most messages don't quote and aren't parsed at all
+    quote = (
+        "case when instr(messages.json, '\"quote\"') "
+        "then json_extract(messages.json, '$.quote') end"
+    )
+    columns = (
+        f"messages.id, messages.sent_at, messages.type, {source}, messages.body, "
+        f"{quote}, "
+        "case when messages.hasAttachments "
+        "then json_extract(nullif(messages.json, ''), '$.attachments') end"
+    )
+    # columns first, SQLite stops at the first false term; older timer updates are
+    # only marked in the JSON, which is parsed when the key is in there at all
+    skip_system_messages = (
+        IsNot("messages.type", SqlString("keychange")),
+        IsNot("messages.type", SqlString("timer-notification")),
+        IsNot("messages.body", "null"),
+        "(instr(messages.json, '\"expirationTimerUpdate\"') = 0 "
+        "or json_type(messages.json, '$.expirationTimerUpdate') is null)",
+    )
+
+    def decode(self, row):
+        message_id, sent_at, msg_type, source, body, quote, attachments = row
+        return Message.from_columns(
+            message_id,
+            sent_at,
+            msg_type,
+            source,
+            body,
+            json_loads(quote) if quote else None,
+            self.load_attachments(attachments),
+        )
+
+    def load_attachments(self, value):
+        return json_loads(value) if value else ()
+
+    def attachment_totals(self):
+        count, size = JsonSchema.attachment_totals(self)
+        return (
+            f"case when messages.hasAttachments then {count} else 0 end",
+            f"case when messages.hasAttachments then {size} end",
+        )
+
+
+class AttachmentTableSchema(ColumnSchema):
+    """attachments moved out of messages.json into their own table; they are read
+    with one query up front and joined by message id"""
+
+    min_version = 1360
+    tables = dict(
+        ColumnSchema.tables,
+        message_attachments=(
+            "messageId",
+            "attachmentType",
+            "orderInMessage",
+            "contentType",
+            "path",
+            "fileName",
+            "size",
+            "thumbnailPath",
+        ),
+    )
+    columns = (
+        f"messages.id, messages.sent_at, messages.type, {ColumnSchema.source}, "
+        f"messages.body, {ColumnSchema.quote}, messages.hasAttachments"
+    )
+    attachment_where = "a.messageId = messages.id and a.attachmentType = 'attachment'"
+
+    def rows(self, dbi, query):
+        self.prepare(query)
+        attachments = {}
+        for message_id, *values in dbi.iterate(
+            "select a.messageId, a.contentType, a.fileName, a.path, a.size, "
+            "a.thumbnailPath from message_attachments as a "
+            "where a.attachmentType = 'attachment' and a.messageId in "
+            f"(select messages.id from messages{query.where}{query.order_by}) "
+            "order by a.messageId, a.orderInMessage"
+        ):
+            data = dict(zip(("contentType", "fileName", "path", "size"), values))
+            data = {key: value for key, value in data.items() if value is not None}
+            if values[-1]:
+                data["thumbnail"] = {"path": values[-1]}
+            attachments.setdefault(message_id, []).append(data)
+        return (
+            tuple(row[:-1]) + (attachments.get(row[0], ()),)
+            for row in dbi.iterate(query)
+        )
+
+    def load_attachments(self, value):
+        return value
+
+    def attachment_totals(self):
+        return (
+            f"(select count(*) from message_attachments as a where {self.attachment_where})",
+            f"(select sum(a.size) from message_attachments as a where {self.attachment_where})",
+        )
+
+
+schemas = (AttachmentTableSchema, ColumnSchema, JsonSchema)  # newest first
+
+
+def detect_schema(session):
+    """the adapter for the database behind `session`, by user_version and the columns
+    that are actually there"""
+    [(version,)] = list(session.iterate("pragma user_version"))
+    tables = {}
+    for table, column in session.iterate(
+        "select m.name as tbl, p.name as col from sqlite_master as m, pragma_table_info(m.name) as p "
+        "where m.type = 'table'"
+    ):
+        tables.setdefault(table, set()).add(column)
+    for schema in schemas:
+        if schema.fits(version, tables):
+            return schema(version)
+    raise SystemExit("no messages table with id, conversationId, sent_at and json")
+
+
+def db_signature(db):
+    """size and mtime of the database and its WAL file, changes with every write"""
+    parts = []
+    for path in (db, f"{db}-wal"):
+        try:
+            st = os.stat(path)
+            parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+        except FileNotFoundError:
+            parts.append("-")
+    return " ".join(parts)
+
+
+class Snapshot:
+    """plaintext copy of the columns the exporter reads, kept in a cache directory
+
+    Indexed for the export query, and rebuilt whenever size or mtime of db.sqlite or
+    its WAL file changed since it was taken."""
+
+    schema = """
+        create table meta(key text primary key, value text);
+        create index messages_conversation_sent on messages(conversationId, sent_at, id);
+    """
+    # indexes of tables only some schema adapters copy
+    indexes = {
+        "message_attachments": "create index message_attachments_message "
+        "on message_attachments(messageId)",
+    }
+    copied = {
+        "conversations": (
+            "id",
+            "type",
+            "members",
+            "name",
+            "profileName",
+            "profileFullName",
+            "profileFamilyName",
+            "e164",
+        ),
+    }
+
+    def __init__(self, cache_dir, paths):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, "snapshot.sqlite")
+        self.paths = paths
+        self.checked = False
+
+    def signature(self):
+        return db_signature(self.paths.db)
+
+    def is_current(self):
+        try:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                row = conn.execute(
+                    "select value from meta where key='signature'"
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return False
+        return row is not None and row[0] == self.signature()
+
+    def build(self, key):
+        # taken before reading, a change while copying makes the next run rebuild
+        signature = self.signature()
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        # a name of its own, two runs rebuilding at the same time don't share a file
+        fd, tmp = tempfile.mkstemp(
+            prefix="snapshot.", suffix=".tmp", dir=self.cache_dir
+        )
+        os.close(fd)
+        try:
+            self.copy(key, tmp, signature)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        os.replace(tmp, self.path)
+
+    def copy(self, key, tmp, signature):
+        """write the snapshot into the file `tmp`"""
+        session = open_session(self.paths.db, key)
+        conn = sqlite3.connect(tmp)
+        try:
+            # the columns the adapter of the real database reads, and its user_version
+            # so the snapshot gets the same adapter
+            source = detect_schema(session)
+            copied = {
+                table: ", ".join(columns)
+                for table, columns in dict(self.copied, **source.tables).items()
+            }
+            for table, columns in copied.items():
+                conn.execute(f"create table {table}({columns})")
+                if table in self.indexes:
+                    conn.execute(self.indexes[table])
+            conn.executescript(self.schema)
+            for table, columns in copied.items():
+                placeholders = ", ".join("?" for _ in columns.split(","))
+                conn.executemany(
+                    f"insert into {table}({columns}) values ({placeholders})",
+                    session.iterate(f"select {columns} from {table}"),
+                )
+            conn.execute("insert into meta values ('signature', ?)", (signature,))
+            conn.execute(f"pragma user_version = {source.version}")
+            conn.commit()
+        finally:
+            conn.close()
+            session.close()
+
+    def open_session(self, key):
+        if not self.checked:
+            if not self.is_current():
+                self.build(key)
+            self.checked = True
+        return SnapshotSession(self.path)
+
+
+class Directory:
+    """display names of all conversations, keyed by conversation id and by phone number
+
+    Loaded with a single query, so resolving a sender never goes back to the database.
+    """
+
+    def __init__(self, dbi):
+        self.names = {}
+        for cid, e164, name, profile_name in dbi.iterate(
+            "select id, e164, name, profileName from conversations"
+        ):
+            parts = [part for part in (name, profile_name) if part]
+            data = "|".join(parts) if parts else "?"
+            self.names[cid] = data
+            if e164:
+                self.names.setdefault(e164, data)
+
+    def get(self, contact_id_or_phone):
+        return self.names.get(contact_id_or_phone, "?")
+
+
+class DBI:
+    def __init__(self, paths, compact_lookup=True, cache_dir=None):
+        self.paths = paths
+        self.compact_lookup = compact_lookup
+        self.snapshot = Snapshot(cache_dir, paths) if cache_dir else None
+        self._directory = None
+        self._schema = None
+        self._idle_sessions = []
+        self.stats = None
+        with open(self.paths.config, "rb") as fh:
+            self.key = json.load(fh)["key"]
+
+    def _acquire_session(self):
+        while self._idle_sessions:
+            session = self._idle_sessions.pop()
+            if not session.closed:
+                return session
+        if self.snapshot is not None:
+            return self.snapshot.open_session(self.key)
+        return open_session(self.paths.db, self.key)
+
+    def close(self):
+        for session in self._idle_sessions:
+            session.close()
+        self._idle_sessions = []
+
+    def iterate(self, sql):
+        """yield result rows (tuples) as the database produces them
+
+        A session is busy until its result is consumed; queries issued meanwhile
+        (name lookups while streaming messages) get a session of their own."""
+        # print(f'SQL> {sql}')
+        session = self._acquire_session()
+        try:
+            yield from session.iterate(str(sql))
+        finally:
+            self._idle_sessions.append(session)
+
+    def execute(self, sql):
+        return list(self.iterate(sql))
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            self._directory = Directory(self)
+        return self._directory
+
+    @property
+    def schema(self):
+        """adapter for the messages table of this database, see detect_schema"""
+        if self._schema is None:
+            session = self._acquire_session()
+            try:
+                self._schema = detect_schema(session)
+            finally:
+                self._idle_sessions.append(session)
+        return self._schema
+
+    def decode(self, row):
+        return self.schema.decode(row)
+
+    def execute_list(self, sql):
+        """values of the first column"""
+        return [row[0] for row in self.iterate(sql)]
+
+    def lookup_tup(self, contact_id_or_phone, compact=True):
+        if compact and self.compact_lookup:
+            return "", ""
+        return contact_id_or_phone, self.directory.get(contact_id_or_phone)
+
+    def lookup(self, contact_id_or_phone, compact=True):
+        result = self.lookup_tup(contact_id_or_phone, compact)
+        if not result[0] and not result[1]:
+            return ""
+        return f"{result[1]} ({result[0]})"
+
+    def find_group_id(self, name):
+        result = self.execute_list(
+            f"select id from conversations where name={SqlString(name)!r}"
+        )
+        if not result:
+            raise SystemExit("Group not found")
+        return result[0]
+
+    def explain(self, query):
+        return render_query_plan(
+            (sid, parent, detail)
+            for sid, parent, _, detail in self.iterate(
+                self.schema.prepare(query).explain()
+            )
+        )
+
+    def list_conversations(self):
+        """(id, type) of all conversations that have messages"""
+        return self.execute(
+            "select id, type from conversations where exists "
+            "(select 1 from messages where messages.conversationId = conversations.id) "
+            "order by id"
+        )
+
+    def conversation_stats(self, where):
+        """(id, type, name, messages, first and last sent_at, attachments, attachment bytes)
+
+        One pass over the messages matching `where`, biggest conversation first."""
+        attachments, size = self.schema.attachment_totals()
+        self.schema.prepare_where(where)
+        return self.execute(
+            "select totals.cid, conversations.type, "
+            "coalesce(conversations.name, conversations.profileName, '?'), "
+            "totals.messages, totals.first, totals.last, totals.attachments, totals.bytes from ("
+            "select conversationId as cid, count(*) as messages, "
+            "min(sent_at) as first, max(sent_at) as last, "
+            f"coalesce(sum({attachments}), 0) as attachments, "
+            f"coalesce(sum({size}), 0) as bytes "
+            f"from messages{where} group by conversationId"
+            ") as totals left join conversations on conversations.id = totals.cid "
+            "order by totals.messages desc, totals.cid"
+        )
+
+    def list_groups(self):
+        for sid, members, name in self.iterate(
+            "select id, members, name from conversations where type='group'"
+        ):
+            members = (members or "").split(" ")
+            print(f"Group:\n\x1b[0;37;40m{sid} \x1b[0m{name}")
+            print("Members:")
+
+            # members = justify1(list(self.lookup(member, False) for member in members))
+            def format_member(m):
+                mid, data = m
+                return f"\x1b[0;37;40m{mid} \x1b[0m{data}"
+
+            print(
+                "\n".join(
+                    format_member(self.lookup_tup(member, False)) for member in members
+                )
+            )
+            print("----------------------")
+
+    def list_ids(self):
+        print("id | profileName | profileFullName | profileFamilyName | number")
+        for info in self.iterate(
+            "select distinct id, profileName, profileFullName, profileFamilyName, e164 from conversations order by id"
+        ):
+            print(" | ".join("" if value is None else str(value) for value in info))
+
+    fetch_rows = 5000  # rows per query of an export, and between --resume checkpoints
+
+    def paged(self, query):
+        """whether pages of `query` come straight off an index; if the plan sorts, every
+        page would sort all the remaining rows again"""
+        return not any(
+            "TEMP B-TREE FOR ORDER BY" in line for line in self.explain(query)
+        )
+
+    def fetch(self, query):
+        """the rows of `query`, `fetch_rows` at a time, each page picking up after the
+        (sent_at, id) the last one ended with"""
+        if not self.paged(query):
+            yield from self.schema.rows(self, query)
+            return
+        after = None
+        while True:
+            fetched = 0
+            for row in self.schema.rows(self, query.page(after, self.fetch_rows)):
+                fetched += 1
+                yield row
+            if fetched < self.fetch_rows:
+                return
+            after = row[1], row[0]
+
+    def process_with_handler(
+        self, query, handler, rotation=None, append=False, jobs=1, checkpoint=None
+    ):
+        """feed the messages of `query` to `handler`
+
+        With `append`, handler.out continues an earlier export, so there is no header.
+        With `jobs` > 1, messages are decoded and rendered by that many processes.
+        A `checkpoint` is saved every `fetch_rows` rows.
+        Returns (sent_at, id) of the last message, None if there was none."""
+        self.directory  # load names up front, not in the middle of the stream
+        self.schema.prepare(query)
+        rows = self.fetch(query)
+        if rotation is None and not append:
+            handler.begin()
+            handler.add_info(repr(query))
+        if jobs > 1:
+            last, fetched = self._process_in_workers(
+                query, rows, handler, rotation, jobs, checkpoint
+            )
+        else:
+            last = None
+            fetched = 0
+            for row in rows:
+                if checkpoint is not None and last and fetched % self.fetch_rows == 0:
+                    checkpoint.save(last)
+                fetched += 1
+                message = self.decode(row)
+                if message is None:
+                    continue
+                if rotation is not None:
+                    rotation.advance(row[1], handler, repr(query))
+                handler.eat(message, self.lookup)
+                last = row[1], row[0]
+        if self.stats is not None:
+            self.stats.count("rows_fetched", fetched)
+        if rotation is None:
+            handler.end()
+        else:
+            rotation.close(handler)
+        return last
+
+    chunk_size = 500  # rows per --jobs work unit
+
+    def _process_in_workers(self, query, rows, handler, rotation, jobs, checkpoint):
+        """the loop of process_with_handler, with decoding and rendering done in `jobs`
+        worker processes
+
+        Rows go out in chunks and the rendered messages are written back in order, with
+        the attachment copies the workers asked for, so the output is the same as from a
+        single process. Returns the last (sent_at, id) and the number of rows fetched.
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from .workers import _init_render_worker, render_chunk
+
+        mirror = self.paths.mirror
+        pool = ProcessPoolExecutor(
+            max_workers=jobs,
+            # forking would copy the copy threads' locks and the sqlcipher pipes
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_render_worker,
+            initargs=(
+                type(handler),
+                self.paths.base,
+                self.schema,
+                self.directory,
+                self.compact_lookup,
+                handler.inline_text_limit,
+                (mirror.root, mirror.link_dir) if mirror else None,
+                self.stats is not None,
+            ),
+        )
+        info = repr(query)
+        last = None
+        fetched = 0
+        written = 0
+        pending = collections.deque()
+        chunk = []
+
+        def write_back():
+            nonlocal last, written
+            last = (
+                self._write_rendered(pending.popleft(), handler, rotation, info) or last
+            )
+            written += 1
+            if checkpoint is not None and last:
+                if written % (self.fetch_rows // self.chunk_size) == 0:
+                    checkpoint.save(last)
+
+        with pool:
+            for row in rows:
+                fetched += 1
+                chunk.append(row)
+                if len(chunk) < self.chunk_size:
+                    continue
+                pending.append(pool.submit(render_chunk, chunk))
+                chunk = []
+                # keeps every worker busy without queueing up the whole conversation
+                if len(pending) > 2 * jobs:
+                    write_back()
+            if chunk:
+                pending.append(pool.submit(render_chunk, chunk))
+            while pending:
+                write_back()
+        return last, fetched
+
+    def _write_rendered(self, future, handler, rotation, info):
+        """write a chunk back, returns (sent_at, id) of its last message or None"""
+        rendered, measured = future.result()
+        if measured is not None:
+            self.stats.merge(measured)
+        if not rendered:
+            return None
+        for message_id, sent_at, text, attachments in rendered:
+            for src, subpath in attachments:
+                self.paths.mirror.get(src, subpath)
+            if rotation is not None:
+                rotation.advance(sent_at, handler, info)
+            if text:
+                handler.out.write(text)
+                handler.written += 1
+        return sent_at, message_id
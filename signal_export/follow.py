@@ -0,0 +1,116 @@
+"""--follow"""
+
+import os, select, struct
+import ctypes, ctypes.util
+import time
+
+from .db import db_signature
+from .query import build_query
+
+
+class Watcher:
+    """waits for writes to the database or its WAL file, for --follow
+
+    Uses inotify (through ctypes, on the database's directory as the WAL file comes and
+    goes) where the C library has it, and compares db_signature every `interval`
+    seconds otherwise."""
+
+    # IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    events = 0x2 | 0x8 | 0x80 | 0x100
+    interval = 0.5
+    settle = 0.1  # seconds of quiet before querying, one message is several writes
+
+    def __init__(self, db):
+        self.db = db
+        self.names = {os.path.basename(db), f"{os.path.basename(db)}-wal"}
+        self.fd = self.inotify(os.path.dirname(db))
+        self.signature = db_signature(db)
+
+    def inotify(self, directory):
+        """an inotify descriptor watching `directory`, None where there is none"""
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError):
+            return None
+        fd = init(os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if add_watch(fd, os.fsencode(directory), self.events) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def touched(self, data):
+        """whether a read of inotify events has one for the database or its WAL"""
+        pos = 0
+        while pos < len(data):
+            _, _, _, length = struct.unpack_from("iIII", data, pos)
+            name = data[pos + 16 : pos + 16 + length].rstrip(b"\0")
+            pos += 16 + length
+            if os.fsdecode(name) in self.names:
+                return True
+        return False
+
+    def wait(self):
+        """return once the database changed since the last call"""
+        if self.fd is None:
+            while db_signature(self.db) == self.signature:
+                time.sleep(self.interval)
+        else:
+            while not self.touched(os.read(self.fd, 65536)):
+                pass
+            while select.select([self.fd], [], [], self.settle)[0]:
+                os.read(self.fd, 65536)
+        self.signature = db_signature(self.db)
+
+
+def follow(args, dbi, handler, last, marks):
+    """--follow: append the conversation's new messages to the export as they arrive,
+    until interrupted"""
+    # the snapshot would be rebuilt on every write, tail the database itself
+    dbi.snapshot = None
+    dbi.close()
+    footer = handler.footer.encode("utf-8")
+    watcher = Watcher(dbi.paths.db)
+    # the export so far is complete, get it to disk before waiting for Signal
+    handler.out.flush()
+    try:
+        while True:
+            try:
+                watcher.wait()
+            except KeyboardInterrupt:
+                return
+            query = dbi.schema.prepare(
+                build_query(args, args.conversation, last, tail=True)
+            )
+            if not dbi.execute(f"select 1 from messages{query.where} limit 1"):
+                continue  # a write to another conversation
+            dbi._directory = None  # new contacts have names too
+            if footer:
+                # the footer goes back to the end when the handler is done
+                out = handler.out
+                out.flush()
+                out.seek(out.tell() - len(footer))
+                out.truncate()
+            try:
+                last = dbi.process_with_handler(query, handler, append=True) or last
+            except KeyboardInterrupt:
+                # interrupted mid-batch: close the page again, the mark stays at the
+                # last complete batch
+                handler.out.write(handler.footer)
+                handler.out.flush()
+                return
+            handler.out.flush()
+            if dbi.paths.mirror:
+                dbi.paths.mirror.drain()
+            if marks:
+                marks.set(args.out, args.conversation, last)
+                marks.save()
+    finally:
+        watcher.close()
@@ -0,0 +1,126 @@
+"""the --index full text search index"""
+
+import os
+import sqlite3
+
+from .db import Directory
+from .query import Where
+
+
+class SearchIndex:
+    """full text index of message bodies, quotes and senders in a local SQLite FTS5 database
+
+    Like the snapshot cache, this is a plaintext copy of your messages. update() adds
+    what was sent after the newest indexed message, searching never opens the
+    encrypted database."""
+
+    schema = """
+        create table messages(rowid integer primary key, id text unique, conversationId text,
+            sent_at integer, source text, body text, quote text, json text);
+        create index messages_conversation_sent on messages(conversationId, sent_at, id);
+        create table conversations(id text primary key, e164 text, name text, profileName text);
+        create virtual table search using fts5(body, quote, source, content='messages',
+            content_rowid='rowid', tokenize='unicode61 remove_diacritics 2');
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._directory = None
+        exists = os.path.exists(path)
+        if not exists:
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        self.conn = sqlite3.connect(path)
+        if not exists:
+            self.conn.executescript(self.schema)
+
+    def close(self):
+        self.conn.close()
+
+    def iterate(self, sql, params=()):
+        yield from self.conn.execute(sql, params)
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            self._directory = Directory(self)
+        return self._directory
+
+    def lookup(self, contact_id_or_phone, compact=True):
+        # results span conversations, so senders always get their full name
+        return f"{self.directory.get(contact_id_or_phone)} ({contact_id_or_phone})"
+
+    def update(self, dbi):
+        """index the messages sent since the last update, returns how many there were"""
+        where = Where()
+        last = self.conn.execute(
+            "select sent_at, id from messages order by rowid desc limit 1"
+        ).fetchone()
+        if last:
+            where.add_after(*last)
+        where.add_skip_system_messages()
+        first_new = self.conn.execute("select coalesce(max(rowid), 0) from messages")
+        first_new = first_new.fetchone()[0] + 1
+        rows = dbi.iterate(
+            "select messages.id, messages.conversationId, messages.sent_at, "
+            "json_extract(messages.json, '$.source'), json_extract(messages.json, '$.body'), "
+            "json_extract(messages.json, '$.quote.text'), messages.json "
+            f"from messages{where} order by messages.sent_at, messages.id"
+        )
+        added = self.conn.executemany(
+            "insert or ignore into messages(id, conversationId, sent_at, source, body, quote, json) "
+            "values (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        ).rowcount
+        self.conn.execute(
+            "insert into search(rowid, body, quote, source) "
+            "select rowid, body, quote, source from messages where rowid >= ?",
+            (first_new,),
+        )
+        # names change, and there are few conversations: copy them all every time
+        self.conn.execute("delete from conversations")
+        self.conn.executemany(
+            "insert into conversations values (?, ?, ?, ?)",
+            dbi.iterate("select id, e164, name, profileName from conversations"),
+        )
+        self.conn.commit()
+        return added
+
+    def search(self, query, conversation_id=None, limit=50, context=2):
+        """windows of `context` messages around the `limit` best matches of `query`
+
+        Returns [(conversation id, [(id, sent_at, json)])], grouped by conversation and in
+        order of time, overlapping windows merged."""
+        sql = (
+            "select messages.conversationId, messages.sent_at, messages.id from search "
+            "join messages on messages.rowid = search.rowid where search match ?"
+        )
+        params = [query]
+        if conversation_id:
+            sql += " and messages.conversationId = ?"
+            params.append(conversation_id)
+        try:
+            hits = self.conn.execute(f"{sql} order by rank limit ?", params + [limit])
+            hits = sorted(hits)
+        except sqlite3.OperationalError as e:
+            raise SystemExit(f"--search: {e}")
+        windows = []
+        for cid, sent_at, message_id in hits:
+            before = self.conn.execute(
+                "select id, sent_at, json from messages where conversationId = ? "
+                "and (sent_at, id) < (?, ?) order by sent_at desc, id desc limit ?",
+                (cid, sent_at, message_id, context),
+            ).fetchall()
+            after = self.conn.execute(
+                "select id, sent_at, json from messages where conversationId = ? "
+                "and (sent_at, id) >= (?, ?) order by sent_at, id limit ?",
+                (cid, sent_at, message_id, context + 1),
+            ).fetchall()
+            rows = before[::-1] + after
+            if windows and windows[-1][0] == cid:
+                shown = windows[-1][1]
+                end = shown[-1][1], shown[-1][0]
+                if (rows[0][1], rows[0][0]) <= end:
+                    shown.extend(row for row in rows if (row[1], row[0]) > end)
+                    continue
+            windows.append((cid, rows))
+        return windows
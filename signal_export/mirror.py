@@ -0,0 +1,179 @@
+"""copying attachments next to an export"""
+
+import sys, os, subprocess, shutil, errno, hashlib
+import threading, time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def reflink(src, dst):
+    """copy-on-write clone of `src`; raises OSError where the filesystem can't do it"""
+    if sys.platform == "darwin":
+        subprocess.run(["cp", "-c", src, dst], check=True, stderr=subprocess.DEVNULL)
+        return
+    import fcntl
+
+    FICLONE = 0x40049409  # linux/fs.h
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+class AttachmentMirror:
+    """copies attachments next to the export
+
+    Files that are already there (same inode, or same size and mtime - or content, with
+    check="hash") are left alone, and every attachment is handled at most once per run.
+    Links are relative to `link_dir`, the directory of the export file.
+    """
+
+    def __init__(self, root, link_mode="copy", check="stat", workers=0, link_dir="."):
+        self.root = root
+        self.link_dir = link_dir
+        self.link_mode = link_mode
+        self.check = check
+        self.mirrored = {}
+        self.lock = threading.Lock()
+        self.pool = None
+        if workers > 0:
+            self.pool = ThreadPoolExecutor(max_workers=workers)
+            # bounds the backlog, so a fast renderer can't queue up the whole conversation
+            self.slots = threading.BoundedSemaphore(workers * 4)
+        self.pending = []
+        self.errors = []
+        self.started = None
+        self.files_copied = 0
+        self.bytes_copied = 0
+        self.files_unchanged = 0
+
+    def get(self, src, subpath):
+        """link to the copy of `src`; with workers the copy itself happens in the background"""
+        dst = self.mirrored.get(subpath)
+        if dst is None:
+            # a missing attachment is still the caller's problem
+            src_stat = os.stat(src)
+            dst = os.path.join(self.root, subpath)
+            self.mirrored[subpath] = dst
+            if self.started is None:
+                self.started = time.monotonic()
+            if self.pool is None:
+                self.mirror(src, src_stat, dst)
+            else:
+                self.slots.acquire()
+                self.pending.append(
+                    self.pool.submit(self._mirror_in_pool, src, src_stat, dst)
+                )
+        return os.path.relpath(dst, self.link_dir)
+
+    def _mirror_in_pool(self, src, src_stat, dst):
+        try:
+            self.mirror(src, src_stat, dst)
+        except Exception as e:
+            with self.lock:
+                self.errors.append((src, e))
+        finally:
+            self.slots.release()
+
+    def mirror(self, src, src_stat, dst):
+        if self.up_to_date(src, src_stat, dst):
+            with self.lock:
+                self.files_unchanged += 1
+            return
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        self.transfer(src, dst)
+        with self.lock:
+            self.files_copied += 1
+            self.bytes_copied += src_stat.st_size
+
+    def drain(self):
+        """wait for the copies scheduled so far"""
+        wait(self.pending)
+        self.pending = []
+        for src, e in self.errors:
+            print(f"could not mirror {src}: {e}", file=sys.stderr)
+        self.errors = []
+
+    def finish(self, report=True):
+        """wait for pending copies, stop the copy threads and report throughput on stderr"""
+        self.drain()
+        if self.pool is not None:
+            self.pool.shutdown()
+        if self.started is None or not report:
+            return
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        mb = self.bytes_copied / 1e6
+        print(
+            f"attachments: {self.files_copied} files, {mb:.1f} MB mirrored in {elapsed:.2f} s "
+            f"({self.files_copied / elapsed:.1f} files/s, {mb / elapsed:.1f} MB/s), "
+            f"{self.files_unchanged} already up to date",
+            file=sys.stderr,
+        )
+
+    def up_to_date(self, src, src_stat, dst):
+        try:
+            dst_stat = os.stat(dst)
+        except FileNotFoundError:
+            return False
+        # hard or symbolic link from an earlier run
+        if os.path.samestat(src_stat, dst_stat):
+            return True
+        if src_stat.st_size != dst_stat.st_size:
+            return False
+        if self.check == "hash":
+            return file_digest(src) == file_digest(dst)
+        return abs(src_stat.st_mtime - dst_stat.st_mtime) < 1
+
+    def transfer(self, src, dst):
+        if self.link_mode != "copy" and os.path.lexists(dst):
+            os.unlink(dst)
+        if self.link_mode == "symlink":
+            os.symlink(os.path.abspath(src), dst)
+            return
+        try:
+            if self.link_mode == "hardlink":
+                os.link(src, dst)
+                return
+            if self.link_mode == "reflink":
+                reflink(src, dst)
+                return
+        except (OSError, subprocess.CalledProcessError) as e:
+            if isinstance(e, OSError) and e.errno not in (
+                errno.EXDEV,
+                errno.EPERM,
+                errno.EOPNOTSUPP,
+                errno.ENOTTY,
+                errno.EINVAL,
+            ):
+                raise
+            # no links across filesystems, no reflinks without filesystem support
+            if os.path.lexists(dst):
+                os.unlink(dst)
+        shutil.copy2(src, dst)  # copy2 keeps the mtime the next run compares against
+
+
+class RecordingMirror:
+    """stands in for the AttachmentMirror in --jobs workers
+
+    Answers with the same link as the real one, the main process does the copying when
+    it writes the message."""
+
+    def __init__(self, root, link_dir="."):
+        self.root = root
+        self.link_dir = link_dir
+        self.requests = []
+
+    def get(self, src, subpath):
+        os.stat(src)  # a missing attachment fails the same way
+        self.requests.append((src, subpath))
+        return os.path.relpath(os.path.join(self.root, subpath), self.link_dir)
+
+    def take(self):
+        requests, self.requests = self.requests, []
+        return requests
@@ -0,0 +1,69 @@
+"""messages as the handlers and the library API see them"""
+
+import json
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+
+class Attachment:
+    __slots__ = ("path", "content_type", "file_name", "thumbnail_path", "raw")
+
+    def __init__(self, data):
+        self.path = data.get("path")
+        self.content_type = data.get("contentType", "")
+        self.file_name = data.get("fileName")
+        thumbnail = data.get("thumbnail")
+        self.thumbnail_path = thumbnail.get("path") if thumbnail else None
+        self.raw = data  # dumped as is for files that can't be shown inline
+
+
+class Quote:
+    __slots__ = ("id", "author", "text", "has_text", "attachments")
+
+    def __init__(self, data):
+        self.id = data.get("id")
+        self.author = data.get("author")
+        self.has_text = "text" in data
+        self.text = data.get("text")
+        attachments = data.get("attachments")
+        self.attachments = (
+            None if attachments is None else [Attachment(att) for att in attachments]
+        )
+
+
+class Message:
+    """the parts of a message's JSON the handlers render, decoded once per row"""
+
+    __slots__ = ("id", "sent_at", "type", "source", "body", "quote", "attachments")
+
+    def __init__(self, message_id, sent_at, data):
+        self.id = message_id
+        self.sent_at = data.get("sent_at", sent_at)
+        self.type = data.get("type")
+        self.source = data.get("source")
+        self.body = data.get("body")
+        quote = data.get("quote")
+        self.quote = Quote(quote) if quote else None
+        self.attachments = [Attachment(att) for att in data.get("attachments", ())]
+
+    @classmethod
+    def decode(cls, message_id, sent_at, raw):
+        return cls(message_id, sent_at, json_loads(raw))
+
+    @classmethod
+    def from_columns(
+        cls, message_id, sent_at, msg_type, source, body, quote, attachments
+    ):
+        """a Message from native columns, quote and attachments already decoded"""
+        message = cls.__new__(cls)
+        message.id = message_id
+        message.sent_at = sent_at
+        message.type = msg_type
+        message.source = source
+        message.body = body
+        message.quote = Quote(quote) if quote else None
+        message.attachments = [Attachment(att) for att in attachments]
+        return message
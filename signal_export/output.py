@@ -0,0 +1,233 @@
+"""output files: appending, checkpoints, --split-by and --page-size"""
+
+import os, json, re
+from datetime import datetime, timedelta
+
+
+def open_export(path, footer="", append=False):
+    """open `path` for a new export, or with `append` continue an existing one
+
+    Continuing cuts `footer` off the end of the file, the handler writes it again when
+    it is done. Returns the file and whether an existing export is being continued."""
+    if append and os.path.exists(path):
+        tail = footer.encode("utf-8")
+        with open(path, "rb+") as fh:
+            size = fh.seek(0, os.SEEK_END)
+            fh.seek(max(size - len(tail), 0))
+            if fh.read() != tail:
+                raise SystemExit(f"{path} doesn't end with {footer!r}, can't append")
+            fh.truncate(size - len(tail))
+        return open(path, "a", encoding="utf-8"), True
+    # yes, we are opinionated, also the html meta tag kinda forces this
+    return open(path, "w", encoding="utf-8"), False
+
+
+class HighWaterMarks:
+    """(sent_at, id) of the last exported message per output file and conversation"""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, encoding="utf-8") as fh:
+                self.marks = json.load(fh)
+        except FileNotFoundError:
+            self.marks = {}
+
+    def get(self, out, conversation_id):
+        mark = self.marks.get(out, {}).get(conversation_id)
+        return tuple(mark) if mark else None
+
+    def set(self, out, conversation_id, mark):
+        self.marks.setdefault(out, {})[conversation_id] = list(mark)
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.marks, fh, indent=1)
+        os.replace(tmp, self.path)
+
+
+class Checkpoint:
+    """(sent_at, id) of the last message written to a single file export and the size
+    of the file at that point, for --resume after an interrupted export
+
+    Saved as OUT.checkpoint while the export runs and removed once it is complete."""
+
+    def __init__(self, out_path, conversation_id):
+        self.out_path = out_path
+        self.path = f"{out_path}.checkpoint"
+        self.conversation_id = conversation_id
+        self.cursor = None
+        self.out = None
+        self.mirror = None  # the AttachmentMirror of the export, if any
+
+    def save(self, last):
+        # messages before the cursor aren't rendered again by --resume, so their
+        # attachments have to be copied, and the output on disk, before the checkpoint
+        if self.mirror is not None:
+            self.mirror.drain()
+        self.out.flush()
+        os.fsync(self.out.fileno())
+        state = {
+            "conversation": self.conversation_id,
+            "cursor": list(last),
+            "offset": self.out.tell(),
+        }
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(state, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """the saved state: conversation, cursor and offset"""
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                state = json.load(fh)
+        except FileNotFoundError:
+            raise SystemExit(f"no checkpoint {self.path}, nothing to resume")
+        if state["conversation"] != self.conversation_id:
+            raise SystemExit(
+                f"{self.path} is from an export of {state['conversation']}, not {self.conversation_id}"
+            )
+        return state
+
+    def resume(self):
+        """cut the export back to the checkpoint and open it for appending"""
+        state = self.load()
+        if os.path.getsize(self.out_path) < state["offset"]:
+            raise SystemExit(f"{self.out_path} is shorter than its checkpoint")
+        os.truncate(self.out_path, state["offset"])
+        self.cursor = tuple(state["cursor"])
+        self.out = open(self.out_path, "a", encoding="utf-8")
+        return self.out
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Rotation:
+    """switches the handler to a new output file whenever a message starts a new period
+
+    `split_by` is "month", "week", "year" or a number of messages per file. File names
+    come from `pattern` via strftime on the start of the period (or on the first message
+    of a numbered part), %N is replaced by the running part number."""
+
+    periods = ("month", "week", "year")
+
+    def __init__(self, pattern, split_by, append=False):
+        self.pattern = pattern
+        self.split_by = split_by
+        self.append = append
+        self.current = None
+        self.part = 0
+        self.seen = 0
+        # names used in this run, a repeat would truncate an earlier period
+        self.opened = set()
+        self.outputs = []  # (path, size before this export), for --stats
+
+    @classmethod
+    def parse_split_by(cls, value):
+        if value in cls.periods:
+            return value
+        match = re.fullmatch(r"(\d+)(-messages)?", value)
+        if not match or int(match.group(1)) < 1:
+            raise SystemExit(
+                f"--split-by: expected one of {', '.join(cls.periods)} or N-messages"
+            )
+        return int(match.group(1))
+
+    def period(self, sent_at):
+        """(key, start) of the period `sent_at` falls into"""
+        dt = datetime.fromtimestamp(sent_at / 1000)
+        day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.split_by == "year":
+            return dt.year, day.replace(month=1, day=1)
+        if self.split_by == "month":
+            return (dt.year, dt.month), day.replace(day=1)
+        if self.split_by == "week":
+            monday = day - timedelta(days=dt.weekday())
+            return monday, monday
+        self.seen += 1
+        return (self.seen - 1) // self.split_by, dt
+
+    def file_name(self, start):
+        return start.strftime(self.pattern.replace("%N", f"{self.part:04d}"))
+
+    def advance(self, sent_at, handler, info):
+        key, start = self.period(sent_at)
+        if key == self.current:
+            return
+        self.close(handler)
+        self.current = key
+        self.part += 1
+        path = self.file_name(start)
+        if path in self.opened:
+            self.current = None  # already closed above
+            raise SystemExit(
+                f"--out: {self.pattern!r} names two periods {path}, "
+                "add the fields that tell them apart (e.g. %m, %d or %N)"
+            )
+        self.opened.add(path)
+        handler.out, appended = open_export(path, handler.footer, self.append)
+        self.outputs.append((path, handler.out.tell()))
+        if not appended:
+            handler.begin()
+            handler.add_info(info)
+
+    def close(self, handler):
+        if self.current is not None:
+            handler.end()
+            handler.out.close()
+
+
+class Pagination:
+    """HTML pages of `page_size` messages each, linked to each other and to an index
+
+    The index is written to `out`, the pages next to it as <name>-0001.html etc."""
+
+    def __init__(self, out, page_size):
+        root, ext = os.path.splitext(out)
+        self.pattern = f"{root}-{{:04d}}{ext}"
+        self.index = out
+        self.page_size = page_size
+        self.seen = 0
+        self.pages = []
+        self.outputs = []  # (path, 0), for --stats
+
+    def advance(self, sent_at, handler, info):
+        if self.seen % self.page_size == 0:
+            path = self.pattern.format(len(self.pages) + 1)
+            if self.pages:
+                self.end_page(handler, next_page=os.path.basename(path))
+            prev_page = os.path.basename(self.pages[-1][0]) if self.pages else None
+            self.pages.append([path, sent_at, sent_at, 0])
+            handler.out = open(path, "w", encoding="utf-8")
+            self.outputs.append((path, 0))
+            handler.page = os.path.basename(path)
+            handler.begin()
+            handler.add_info(info)
+            handler.navigation(os.path.basename(self.index), prev_page, None)
+        self.seen += 1
+        self.pages[-1][2] = sent_at
+        self.pages[-1][3] += 1
+
+    def end_page(self, handler, next_page):
+        prev_page = os.path.basename(self.pages[-2][0]) if len(self.pages) > 1 else None
+        handler.navigation(os.path.basename(self.index), prev_page, next_page)
+        handler.end()
+        handler.out.close()
+
+    def close(self, handler):
+        if self.pages:
+            self.end_page(handler, None)
+        handler.out = open(self.index, "w", encoding="utf-8")
+        self.outputs.append((self.index, 0))
+        handler.begin()
+        handler.index([[os.path.basename(page[0])] + page[1:] for page in self.pages])
+        handler.end()
+        handler.out.close()
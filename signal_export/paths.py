@@ -0,0 +1,54 @@
+"""where signal desktop keeps its files"""
+
+import sys, os
+from pathlib import Path
+
+
+class SignalPaths:
+    base = None
+    mirror = None
+    thumbnails = None
+
+    @classmethod
+    def default(cls):
+        if sys.platform == "darwin":
+            return OsxPaths()
+        else:
+            return LinuxPaths()
+
+    @property
+    def config(self):
+        return os.path.join(self.base, "config.json")
+
+    @property
+    def db(self):
+        return os.path.join(self.base, "sql", "db.sqlite")
+
+    def attachment_source(self, subpath):
+        return os.path.join(self.base, "attachments.noindex", subpath)
+
+    def get_attachment(self, subpath):
+        src = self.attachment_source(subpath)
+        if not self.mirror:
+            return src
+        return self.mirror.get(src, subpath)
+
+    def get_thumbnail(self, subpath):
+        return self.thumbnails.get(self.attachment_source(subpath))
+
+
+class OsxPaths(SignalPaths):
+    @property
+    def base(self):
+        return os.path.join(Path.home(), "Library", "Application Support", "Signal")
+
+
+class LinuxPaths(SignalPaths):
+    @property
+    def base(self):
+        return os.path.join(Path.home(), ".config", "Signal")
+
+
+class CustomPaths(SignalPaths):
+    def __init__(self, base):
+        self.base = base
@@ -0,0 +1,63 @@
+"""the library API: messages of a profile as Python objects instead of exported text"""
+
+from .db import DBI
+from .paths import SignalPaths, CustomPaths
+from .query import Query, Where
+
+
+class Profile:
+    """a Signal desktop profile opened for reading, see open_profile"""
+
+    def __init__(self, paths, cache_dir=None):
+        self.paths = paths
+        self.dbi = DBI(paths, compact_lookup=False, cache_dir=cache_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.dbi.close()
+
+    def conversations(self):
+        """(id, type) of all conversations that have messages"""
+        return self.dbi.list_conversations()
+
+    def name(self, contact_id_or_phone):
+        """display name of a conversation id or phone number, "?" if unknown"""
+        return self.dbi.directory.get(contact_id_or_phone)
+
+    def attachment_path(self, attachment):
+        """where the file of a message's Attachment is"""
+        return self.paths.attachment_source(attachment.path)
+
+    def iter_messages(
+        self, conversation, start=None, end=None, include_system_messages=False
+    ):
+        """yield the Messages of conversation id `conversation` in (sent_at, id) order
+
+        `start` (included) and `end` (excluded) are YYYY-MM-DD, YYYY-MM-DD hh:mm or
+        milliseconds like sent_at. Rows are fetched in pages, stopping early is cheap.
+        """
+        query = Query()
+        query.where = Where()
+        if start is not None:
+            query.where.add_sent_gte(start)
+        if end is not None:
+            query.where.add_sent_lt(end)
+        if not include_system_messages:
+            query.where.add_skip_system_messages()
+        query.where.add_conversation_id(conversation)
+        self.dbi.schema.prepare(query)
+        for row in self.dbi.fetch(query):
+            message = self.dbi.decode(row)
+            if message is not None:
+                yield message
+
+
+def open_profile(path=None, cache_dir=None):
+    """open the profile in `path` (default: signal desktop's own), with `cache_dir`
+    reading from a snapshot like --cache-dir"""
+    return Profile(CustomPaths(path) if path else SignalPaths.default(), cache_dir)
@@ -0,0 +1,183 @@
+"""the SQL of the export query"""
+
+import copy
+
+from .util import dwim_datetime
+
+
+class Condition:
+    operator = None
+
+    def __init__(self, field, value):
+        self.field = field
+        self.value = value
+
+    def __repr__(self):
+        return f"{self.field}{self.operator}{self.value}"
+
+
+class Gt(Condition):
+    operator = ">"
+
+
+class Gte(Condition):
+    operator = ">="
+
+
+class Lt(Condition):
+    operator = "<"
+
+
+class Lte(Condition):
+    operator = "<="
+
+
+class Eq(Condition):
+    operator = "="
+
+
+class Like(Condition):
+    operator = " LIKE "
+
+
+class Is(Condition):
+    operator = " is "
+
+
+class IsNot(Condition):
+    operator = " is not "
+
+
+class Sender(Eq):
+    field = ""
+
+
+class SqlString:
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        escaped = self.value.replace("'", "''")
+        return f"'{escaped}'"
+
+
+class SkipSystemMessages:
+    """timer updates, key changes and other messages without a body in the database
+
+    This only needs messages.json; schema adapters with native columns for it swap in
+    their own `conditions`, see JsonSchema.prepare_where."""
+
+    def __init__(self):
+        self.conditions = [
+            Is("json_type(messages.json, '$.expirationTimerUpdate')", "null"),
+            IsNot("json_extract(messages.json, '$.type')", SqlString("keychange")),
+            IsNot("json_type(messages.json, '$.body')", "null"),
+        ]
+
+    def __repr__(self):
+        return " and ".join(str(c) for c in self.conditions)
+
+
+class Where:
+    def __init__(self):
+        self.conditions = []
+
+    def __repr__(self):
+        if len(self.conditions) == 0:
+            return ""
+        else:
+            anded = " and ".join(repr(c) for c in self.conditions)
+            return f" where {anded}"
+
+    def add_sent_gte(self, timestamp):
+        self.conditions.append(Gte("sent_at", dwim_datetime(timestamp)))
+
+    def add_sent_lt(self, timestamp):
+        self.conditions.append(Lt("sent_at", dwim_datetime(timestamp)))
+
+    def add_between(self, old, new):
+        # time intervals should be half-open
+        # http://wrschneider.github.io/2014/01/07/time-intervals-and-other-ranges-should.html
+        # https://web.archive.org/web/20190520230211/http://wrschneider.github.io/2014/01/07/time-intervals-and-other-ranges-should.html
+        self.conditions.append(Gte("sent_at", dwim_datetime(old)))
+        self.conditions.append(Lt("sent_at", dwim_datetime(new)))
+
+    def add_after(self, sent_at, message_id):
+        """only messages after the given one, in (sent_at, id) order"""
+        self.conditions.append(
+            Gt("(sent_at, id)", f"({int(sent_at)}, {SqlString(message_id)!r})")
+        )
+
+    def add_skip_system_messages(self):
+        """drop timer updates, key changes and other messages without a body in the database"""
+        self.conditions.append(SkipSystemMessages())
+
+    def add_conversation_id(self, cid, indexed=True):
+        # "+conversationId" keeps SQLite from using the conversation index, see build_query
+        field = "conversationId" if indexed else "+conversationId"
+        self.conditions.append(Eq(field, SqlString(cid)))
+
+
+class Query:
+    # set by the schema adapter
+    columns = "messages.id, messages.sent_at, messages.json"
+    limit = None
+
+    def __init__(self):
+        self.where = Where()
+
+    def __repr__(self):
+        # conversationId and sent_at are real columns, so this is an index search instead of a scan over every JSON node
+        return f"""select {self.columns} from messages{self.where}{self.order_by};"""
+
+    @property
+    def order_by(self):
+        limit = f" limit {self.limit}" if self.limit else ""
+        return f" order by messages.sent_at, messages.id{limit}"
+
+    def page(self, after, limit):
+        """a copy for the first `limit` rows after (sent_at, id) `after`"""
+        page = copy.copy(self)
+        page.where = Where()
+        page.where.conditions = list(self.where.conditions)
+        if after is not None:
+            page.where.add_after(*after)
+        page.limit = limit
+        return page
+
+    def explain(self):
+        return f"explain query plan {self!r}"
+
+
+def render_query_plan(rows):
+    """turn (id, parent, detail) rows of EXPLAIN QUERY PLAN into an indented tree"""
+    depth = {0: 0}
+    lines = ["QUERY PLAN"]
+    for sid, parent, detail in rows:
+        depth[sid] = depth.get(parent, 0) + 1
+        lines.append("  " * depth[sid] + detail)
+    return lines
+
+
+def build_where(args, after=None):
+    """conditions of --start-at, --end-at and --include-system-messages"""
+    where = Where()
+    if args.start_at:
+        where.add_sent_gte(dwim_datetime(args.start_at))
+    if args.end_at:
+        where.add_sent_lt(dwim_datetime(args.end_at))
+    if after:
+        where.add_after(*after)
+    if not args.include_system_messages:
+        where.add_skip_system_messages()
+    return where
+
+
+def build_query(args, conversation_id, after=None, tail=False):
+    """with `tail`, for the few newest messages of --follow: they are found in the
+    sent_at index, instead of going through all of the conversation's and sorting them
+    """
+    query = Query()
+    query.where = build_where(args, after)
+    query.where.add_conversation_id(conversation_id, indexed=not tail)
+    return query
@@ -0,0 +1,330 @@
+"""the text and html handlers"""
+
+import sys, os, json, html, re
+import codecs, functools
+
+from .util import to_ymd
+
+
+class Textizer:
+    extension = "txt"
+    footer = ""
+
+    def __init__(self, paths, out):
+        self.paths = paths
+        self.out = out
+        self.written = 0
+
+    def begin(self):
+        pass
+
+    def add_info(self, info):
+        pass
+
+    def end(self):
+        pass
+
+    def section(self, title):
+        self.out.write(f"=== {title} ===\n")
+
+    def eat(self, message, lookup):
+        sent_at = to_ymd(message.sent_at)
+        if message.type == "incoming":
+            # print(f'INCOMING {message}')
+            self.out.write(f"{lookup(message.source)} {sent_at}:" + "\n")
+        elif message.type == "outgoing":
+            self.out.write(f"(you) {sent_at}" + "\n")
+        else:
+            self.out.write(("??? " + str(message.type) + "\n"))
+        quote = message.quote
+        if quote and quote.has_text:
+            self.out.write(f"> {lookup(quote.author, compact=False)}" + "\n")
+            self.out.write(f"> {quote.text}" + "\n")
+        for att in message.attachments:
+            if att.path is not None:
+                path = self.paths.get_attachment(att.path)
+                self.out.write(f"attachment file: {path}" + "\n")
+            self.out.write(json.dumps(att.raw, indent=4) + "\n")
+        if message.body:
+            self.out.write(message.body + "\n")
+        self.out.write("-------\n")
+        self.written += 1
+
+
+class Htmlizer:
+    template = """\
+<!doctype html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <style type="text/css">
+    body {
+        background-color: #fff;
+        color: #000;
+        font-family: Arial, Helvetica, sans-serif;
+    }
+    img {
+        max-height: 60vh;
+        max-width: 50vw;
+    }
+    a, a:hover { color: inherit; } 
+    a.quote { text-decoration: none; }
+    a.message_id { 
+        display: block;
+        clear:both;
+        }
+    div.message {
+        display: inline-block;
+        max-width: 75%;
+        border-radius: 0.7em;
+        padding-top: 1em;
+        padding-right: 1em;
+        padding-bottom: 0.5em;
+        padding-left: 1em;
+        display: inline-block;
+        margin: 0.4em 0.8em;
+    }
+    div.incoming {
+        background-color: #ddd;
+        float: left;
+        clear: both;
+    }
+    div.outgoing {
+        background-color: #39f;
+        color: #fff;
+        float: right;
+        clear: both;
+    }
+    div.quote {
+        background-color: #9cf;
+        color: #000;
+    }
+    div.incoming div.quote {
+        border-left:3px solid #38f;
+    }
+    div.outgoing div.quote {
+        border-left:3px solid #fff;
+    }
+    div.attachments {
+        margin: 5px;
+    }
+    div.sender_info {
+        font-size: 0.7em;
+        opacity: 0.6;
+        text-align: right;
+        margin-top: 0.5em;
+    }
+    div.quote div.sender_info {
+        margin-top: -0.8em !important;
+    }
+    span.single_emoji {
+        font-size: 3em;
+    }
+    div.navigation {
+        clear: both;
+        text-align: center;
+        padding: 1em;
+    }
+    </style>
+</head>
+<body>"""
+
+    extension = "html"
+    footer = "</body></html>"
+    inline_text_limit = 65536  # bytes of a text attachment shown in the page
+
+    def __init__(self, paths, out):
+        self.paths = paths
+        self.out = out
+        self.written = 0
+        self.page = None  # file name of the current page, when paginating
+        self.pages_of = {}  # sent_at -> page, for quotes of messages on earlier pages
+        self.images_of = {}  # sent_at -> first image, with thumbnails for quotes of it
+        self.url_detect = re.compile(
+            "(https?|ftp)(://[^\\s/$.?#].[^\\s]*)", flags=re.IGNORECASE | re.DOTALL
+        )
+
+    def begin(self):
+        self.out.write(self.template)
+
+    def add_info(self, info):
+        s = "\n<!-- " + info + " -->\n"
+        self.out.write(s)
+
+    def end(self):
+        self.out.write(self.footer)
+
+    def section(self, title):
+        self.out.write(f'\n<h2 style="clear: both">{html.escape(title)}</h2>\n')
+
+    def navigation(self, index, prev_page, next_page):
+        links = [f'<a href="{index}">index</a>']
+        if prev_page:
+            links.insert(0, f'<a href="{prev_page}">previous</a>')
+        if next_page:
+            links.append(f'<a href="{next_page}">next</a>')
+        self.out.write(f'\n<div class="navigation">{" | ".join(links)}</div>\n')
+
+    def index(self, pages):
+        """list of `pages` as [file name, first sent_at, last sent_at, messages]"""
+        self.out.write('\n<div class="navigation"><ol>\n')
+        for page, first, last, count in pages:
+            self.out.write(
+                f'<li><a href="{page}">{to_ymd(first)} &ndash; {to_ymd(last)}</a> ({count} messages)</li>\n'
+            )
+        self.out.write("</ol></div>\n")
+
+    def quote_href(self, quote_id):
+        page = self.pages_of.get(quote_id)
+        if page is None or page == self.page:
+            return f"#{quote_id}"
+        return f"{page}#{quote_id}"
+
+    def eat(self, message, lookup):
+        quote_elem = ""
+        quote = message.quote
+        if quote:
+            if quote.has_text or quote.attachments is not None:
+                sender_name = lookup(quote.author, compact=False)
+                sender_info_elem = f'<div class="sender_info">{sender_name}</div>'
+                attachments_elem = ""
+                attachments = []
+                if quote.attachments is not None:
+                    for att in quote.attachments:
+                        if att.thumbnail_path:
+                            thumb_path = self.paths.get_attachment(att.thumbnail_path)
+                            img_elem = f'<img loading="lazy" src="{thumb_path}">'
+                        elif quote.id in self.images_of:
+                            # signal keeps no thumbnail, but we have seen the quoted image
+                            thumb_path = self.paths.get_thumbnail(
+                                self.images_of[quote.id]
+                            )
+                            img_elem = f'<img loading="lazy" src="{thumb_path}">'
+                        else:
+                            img_elem = '<div style="border:1px solid red">MISSING</div>'
+                        attachments.append(img_elem)
+                if attachments:
+                    attachments_elem = (
+                        '<div class="attachments">' + "\n".join(attachments) + "</div>"
+                    )
+                else:
+                    attachments_elem = ""
+
+                quote_content = quote.text
+                if quote_content is None:
+                    quote_content = ""
+                quote_content = html.escape(quote_content)
+                quote_elem = f'<a class="quote" href="{self.quote_href(quote.id)}"><div class="message quote">{sender_info_elem}<br>{attachments_elem}{quote_content}</div></a><br>\n'
+
+        attachments = []
+        display_full = len(message.attachments) < 2
+        for att in message.attachments:
+            try:
+                path = self.paths.get_attachment(att.path)
+            except:
+                print("NOOOO", file=sys.stderr)
+                print(att.raw, file=sys.stderr)
+                continue
+            content_type = att.content_type
+            if content_type.startswith("image"):
+                img_path = path
+                if self.paths.thumbnails:
+                    thumb_path = self.paths.get_thumbnail(att.path)
+                    self.images_of.setdefault(message.sent_at, att.path)
+                elif display_full:
+                    thumb_path = img_path
+                else:
+                    thumb_path = self.paths.get_attachment(att.thumbnail_path)
+                img_elem = f'<img loading="lazy" src="{thumb_path}">'
+                a_elem = f'<a href="{img_path}">{img_elem}</a>'
+                attachments.append(a_elem)
+            elif content_type.startswith("video"):
+                video_elem = f'<video controls loop width="500" preload="none"><source src="{path}" type="{content_type}"></video>'
+                attachments.append(video_elem)
+            elif content_type.startswith("audio"):
+                audio_elem = f'<audio controls preload="none"><source src="{path}" type="{content_type}"></video>'
+                attachments.append(audio_elem)
+            elif content_type.startswith("text"):
+                # streamed into the page when the message is written
+                attachments.append(functools.partial(self.inline_text, att, path))
+            else:
+                download = (
+                    f'<a download="{att.file_name}" href="{path}">{att.file_name}</a>'
+                )
+                attachments.append(
+                    download
+                    + "<pre>"
+                    + html.escape(json.dumps(att.raw, indent=4))
+                    + "</pre>"
+                )
+        if message.body:
+            body = html.escape(message.body).replace("\n", "<br>\n")
+            body = re.sub(self.url_detect, r'<a href="\1\2">\1\2</a>', body)
+
+            if len(body) == 1:  # this does not respect modifiers - TODO
+                code_point = ord(body)
+                is_emoji = (0x2700 <= code_point <= 0x27BF) or (
+                    0x1F300 <= code_point <= 0x1F9FF
+                )
+                if is_emoji:
+                    body = f'<span class="single_emoji">{body}</span>'
+
+        else:
+            body = ""
+        if message.type == "incoming":
+            sender_name = lookup(message.source) + " "
+        else:
+            sender_name = ""
+        sent_at = message.sent_at
+        sender_info_elem = (
+            f'<div class="sender_info">{sender_name}{to_ymd(sent_at)}</div>'
+        )
+        if self.page is not None:
+            self.pages_of[sent_at] = self.page
+        has_content = quote_elem or attachments or body
+        if has_content:
+            self.out.write(
+                f'<a class="message_id" name="{sent_at}"></a>\n'
+                f'<div class="message {message.type or ""}">\n{quote_elem}\n'
+            )
+            if attachments:
+                self.out.write('<div class="attachments">')
+                for i, elem in enumerate(attachments):
+                    if i:
+                        self.out.write("\n")
+                    if callable(elem):
+                        elem()
+                    else:
+                        self.out.write(elem)
+                self.out.write("</div>")
+            self.out.write(f"\n{body}\n{sender_info_elem}\n</div>\n")
+            self.written += 1
+
+    def inline_text(self, att, path):
+        """write a text attachment into the page, escaped and cut at inline_text_limit bytes
+
+        Read in chunks, so a huge log file costs no more memory than a short note."""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        left = self.inline_text_limit
+        self.out.write('<div style="white-space: pre-wrap">')
+        # the mirrored copy may still be in flight
+        with open(self.paths.attachment_source(att.path), "rb") as fh:
+            while left > 0:
+                chunk = fh.read(min(left, 1 << 16))
+                if not chunk:
+                    break
+                left -= len(chunk)
+                self.out.write(html.escape(decoder.decode(chunk)))
+            truncated = fh.read(1) != b""
+        if not truncated:
+            self.out.write(html.escape(decoder.decode(b"", final=True)))
+        self.out.write("</div>")
+        if truncated:
+            size = os.path.getsize(self.paths.attachment_source(att.path))
+            self.out.write(
+                f'<a href="{path}">&hellip; {html.escape(att.file_name or path)}, '
+                f"{size} bytes</a>"
+            )
+
+
+handlers = {"text": Textizer, "html": Htmlizer}
@@ -0,0 +1,222 @@
+"""--stats"""
+
+import sys, os, json
+import time
+
+from .util import justify1
+
+
+class Stats:
+    """wall time and calls per stage plus counters, for --stats
+
+    Stages are measured by wrapping the methods doing the work, so an export without
+    --stats runs the plain ones. Stages nest: a name lookup made while rendering only
+    counts for "lookup", "render" is what remains."""
+
+    stages = (
+        "snapshot",
+        "open",
+        "query",
+        "decode",
+        "render",
+        "lookup",
+        "attachments",
+        "thumbnails",
+    )
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        self.nested = []
+        self.started = time.monotonic()
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add(self, stage, seconds, calls=1):
+        self.seconds[stage] = self.seconds.get(stage, 0) + seconds
+        self.calls[stage] = self.calls.get(stage, 0) + calls
+
+    def timed(self, stage, fn):
+        def timed_call(*args, **kwargs):
+            self.nested.append(0.0)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.add(stage, elapsed - self.nested.pop())
+                if self.nested:
+                    self.nested[-1] += elapsed
+
+        return timed_call
+
+    def timed_rows(self, stage, rows):
+        """`rows`, with the time spent waiting for each one counted for `stage`"""
+        fetch = self.timed(stage, next)
+        rows = iter(rows)
+        while True:
+            row = fetch(rows, None)
+            if row is None:
+                return
+            yield row
+
+    def instrument(self, dbi, paths):
+        dbi.stats = self
+        dbi._acquire_session = self.timed("open", dbi._acquire_session)
+        iterate = dbi.iterate
+        dbi.iterate = lambda sql: self.timed_rows("query", iterate(sql))
+        dbi.decode = self.timed("decode", dbi.decode)
+        dbi.lookup = self.timed("lookup", self.counting_lookup(dbi, dbi.lookup))
+        if dbi.snapshot is not None:
+            dbi.snapshot.build = self.timed("snapshot", dbi.snapshot.build)
+        paths.get_attachment = self.timed("attachments", paths.get_attachment)
+        paths.get_thumbnail = self.timed("thumbnails", paths.get_thumbnail)
+
+    def instrument_handler(self, handler):
+        handler.eat = self.timed("render", handler.eat)
+
+    def counting_lookup(self, dbi, lookup):
+        def counted(contact_id_or_phone, compact=True):
+            if compact and dbi.compact_lookup:
+                self.count("lookups_compact")
+            elif contact_id_or_phone in dbi.directory.names:
+                self.count("lookups_resolved")
+            else:
+                self.count("lookups_unknown")
+            return lookup(contact_id_or_phone, compact)
+
+        return counted
+
+    def count_output(self, outputs):
+        """bytes written to [(path, size before the export)]"""
+        for path, start in outputs:
+            self.count("bytes_written", os.path.getsize(path) - start)
+
+    def count_mirror(self, mirror, before=(0, 0, 0)):
+        """attachments mirrored since `mirror` had `before` = mirror_counts(mirror)"""
+        copied, size, unchanged = (
+            now - then for now, then in zip(mirror_counts(mirror), before)
+        )
+        self.count("attachment_files_copied", copied)
+        self.count("attachment_bytes_copied", size)
+        self.count("attachment_files_unchanged", unchanged)
+
+    def take(self):
+        """everything measured so far as a dict, starting over"""
+        data = {
+            "seconds": self.seconds,
+            "calls": self.calls,
+            "counters": self.counters,
+        }
+        self.seconds, self.calls, self.counters = {}, {}, {}
+        return data
+
+    def merge(self, data):
+        for stage, seconds in data["seconds"].items():
+            self.add(stage, seconds, data["calls"][stage])
+        for name, n in data["counters"].items():
+            self.count(name, n)
+
+    def to_dict(self):
+        lookups = sum(
+            self.counters.get(f"lookups_{kind}", 0) for kind in ("resolved", "unknown")
+        )
+        resolved = self.counters.get("lookups_resolved", 0)
+        return {
+            "wall_seconds": time.monotonic() - self.started,
+            "stages": {
+                stage: {"seconds": self.seconds[stage], "calls": self.calls[stage]}
+                for stage in self.ordered_stages()
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "lookup_hit_rate": resolved / lookups if lookups else None,
+        }
+
+    def ordered_stages(self):
+        known = [stage for stage in self.stages if stage in self.seconds]
+        return known + sorted(set(self.seconds) - set(self.stages))
+
+    def report(self, out):
+        data = self.to_dict()
+        lines = [
+            (stage, f"{entry['seconds']:10.3f} s  {entry['calls']:>10} calls")
+            for stage, entry in data["stages"].items()
+        ]
+        lines.append(("total", f"{data['wall_seconds']:10.3f} s"))
+        lines += [(name, f"{n:>12}") for name, n in data["counters"].items()]
+        if data["lookup_hit_rate"] is not None:
+            lines.append(("lookup_hit_rate", f"{data['lookup_hit_rate']:12.1%}"))
+        print("\n".join(justify1(lines)), file=out)
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(self.to_dict(), fh, indent=2)
+            fh.write("\n")
+
+    def write_prometheus(self, path):
+        """node_exporter textfile, replaced atomically so the collector never reads half of it"""
+        data = self.to_dict()
+        lines = [
+            "# HELP signal_export_stage_seconds wall time spent per stage of the last export",
+            "# TYPE signal_export_stage_seconds gauge",
+        ]
+        for stage, entry in data["stages"].items():
+            lines.append(
+                f'signal_export_stage_seconds{{stage="{stage}"}} {entry["seconds"]}'
+            )
+        lines += [
+            "# HELP signal_export_stage_calls calls per stage of the last export",
+            "# TYPE signal_export_stage_calls gauge",
+        ]
+        for stage, entry in data["stages"].items():
+            lines.append(
+                f'signal_export_stage_calls{{stage="{stage}"}} {entry["calls"]}'
+            )
+        for name, n in data["counters"].items():
+            lines.append(f"# TYPE signal_export_{name} gauge")
+            lines.append(f"signal_export_{name} {n}")
+        if data["lookup_hit_rate"] is not None:
+            lines.append("# TYPE signal_export_lookup_hit_rate gauge")
+            lines.append(f"signal_export_lookup_hit_rate {data['lookup_hit_rate']}")
+        lines.append("# TYPE signal_export_wall_seconds gauge")
+        lines.append(f"signal_export_wall_seconds {data['wall_seconds']}")
+        lines.append("# TYPE signal_export_last_run_timestamp_seconds gauge")
+        lines.append(f"signal_export_last_run_timestamp_seconds {time.time()}")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+
+class CountingWriter:
+    """text stream that counts the bytes written through it, for --stats on stdout"""
+
+    def __init__(self, out):
+        self.out = out
+        self.written = 0
+
+    def write(self, s):
+        self.written += len(s.encode("utf-8"))
+        return self.out.write(s)
+
+    def flush(self):
+        self.out.flush()
+
+
+def mirror_counts(mirror):
+    return mirror.files_copied, mirror.bytes_copied, mirror.files_unchanged
+
+
+def wants_stats(args):
+    return bool(args.stats or args.stats_json or args.stats_prom)
+
+
+def report_stats(args, stats):
+    if args.stats:
+        stats.report(sys.stderr)
+    if args.stats_json:
+        stats.write_json(args.stats_json)
+    if args.stats_prom:
+        stats.write_prometheus(args.stats_prom)
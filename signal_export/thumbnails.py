@@ -0,0 +1,97 @@
+"""--thumbnails: downscaled previews of images"""
+
+import sys, os, json, shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .mirror import file_digest
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def make_thumbnail(src, dst, size, image_format):
+    """downscale `src` into `dst`, runs in the Thumbnailer's worker processes
+
+    Anything Pillow can't open is copied as is, the browser may still know what to do
+    with it."""
+    tmp = dst + ".tmp"
+    try:
+        with Image.open(src) as img:
+            img.thumbnail((size, size))
+            if image_format == "jpeg" and img.mode != "RGB":
+                img = img.convert("RGB")
+            img.save(tmp, image_format)
+    except (OSError, Image.DecompressionBombError):
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class Thumbnailer:
+    """downscaled previews of image attachments, made by a pool of worker processes
+
+    Previews are named after the content hash of the image, so they survive renames and
+    every image is shrunk once across all exports sharing the directory. index.json
+    remembers the hash of each source by size and mtime, so a re-export doesn't read
+    every image again. Links are relative to `link_dir`, the directory of the export."""
+
+    formats = {"webp": "webp", "jpeg": "jpg"}
+
+    def __init__(self, root, image_format="webp", size=480, workers=None, link_dir="."):
+        self.root = root
+        self.link_dir = link_dir
+        self.image_format = image_format
+        self.size = size
+        self.workers = workers
+        self.pool = None
+        self.made = {}  # file name -> future, or None when it already existed
+        self.index_path = os.path.join(root, "index.json")
+        try:
+            with open(self.index_path, encoding="utf-8") as fh:
+                self.digests = json.load(fh)
+        except FileNotFoundError:
+            self.digests = {}
+
+    def digest(self, src):
+        st = os.stat(src)
+        key = f"{src}|{st.st_size}|{st.st_mtime_ns}"
+        digest = self.digests.get(key)
+        if digest is None:
+            digest = self.digests[key] = file_digest(src).hex()
+        return digest
+
+    def get(self, src):
+        """link to the preview of `src`; it is generated in the background"""
+        name = f"{self.digest(src)}.{self.formats[self.image_format]}"
+        dst = os.path.join(self.root, name)
+        if name not in self.made:
+            if os.path.exists(dst):
+                self.made[name] = None
+            else:
+                if self.pool is None:
+                    os.makedirs(self.root, exist_ok=True)
+                    # forking would copy the copy threads' locks and the sqlcipher pipes
+                    self.pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                self.made[name] = self.pool.submit(
+                    make_thumbnail, src, dst, self.size, self.image_format
+                )
+        return os.path.relpath(dst, self.link_dir)
+
+    def finish(self):
+        """wait for the previews and save the index"""
+        if self.pool is not None:
+            for future in self.made.values():
+                if future is not None and future.exception() is not None:
+                    print(
+                        f"could not make thumbnail: {future.exception()}",
+                        file=sys.stderr,
+                    )
+            self.pool.shutdown()
+        if self.made:
+            with open(self.index_path, "w", encoding="utf-8") as fh:
+                json.dump(self.digests, fh)
@@ -0,0 +1,170 @@
+"""worker processes of --jobs and --all-conversations"""
+
+import os, re, io
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .db import DBI
+from .mirror import AttachmentMirror, RecordingMirror
+from .output import open_export, HighWaterMarks
+from .paths import CustomPaths
+from .query import build_query
+from .render import handlers
+from .stats import Stats, wants_stats, report_stats
+from .util import justify1
+
+
+def safe_file_name(name):
+    return re.sub(r"[^\w.+-]", "_", name)
+
+
+# per worker process state of --all-conversations and --jobs, set up by
+# _init_export_worker and _init_render_worker
+_worker = {}
+
+
+def _init_render_worker(
+    handler_class,
+    base,
+    schema,
+    directory,
+    compact_lookup,
+    inline_text_limit,
+    mirror,
+    stats,
+):
+    paths = CustomPaths(base)
+    if mirror is not None:
+        paths.mirror = RecordingMirror(*mirror)
+    dbi = DBI(paths, compact_lookup=compact_lookup)
+    dbi._schema = schema
+    dbi._directory = directory
+    handler = handler_class(paths, None)
+    handler.inline_text_limit = inline_text_limit
+    stats = Stats() if stats else None
+    if stats:
+        stats.instrument(dbi, paths)
+        stats.instrument_handler(handler)
+    _worker.update(paths=paths, dbi=dbi, handler=handler, stats=stats)
+
+
+def render_chunk(rows):
+    """render rows of the export query for a --jobs export
+
+    Returns [(id, sent_at, text, attachments to mirror)] and with --stats what
+    Stats.take measured."""
+    paths, dbi, handler, stats = (
+        _worker[k] for k in ("paths", "dbi", "handler", "stats")
+    )
+    handler.out = out = io.StringIO()
+    ends = []
+    for row in rows:
+        message = dbi.decode(row)
+        if message is None:
+            continue
+        handler.eat(message, dbi.lookup)
+        ends.append((row, out.tell(), paths.mirror.take() if paths.mirror else []))
+    text = out.getvalue()
+    rendered = []
+    start = 0
+    for row, end, attachments in ends:
+        rendered.append((row[0], row[1], text[start:end], attachments))
+        start = end
+    return rendered, stats.take() if stats else None
+
+
+def _init_export_worker(args, base, directory, marks):
+    paths = CustomPaths(base)
+    dbi = DBI(paths, cache_dir=args.cache_dir)
+    if dbi.snapshot is not None:
+        # export_all has just checked it, or rebuilt it; a change to the database
+        # while the workers run must not have each of them rebuild it again
+        dbi.snapshot.checked = True
+    dbi._directory = directory
+    stats = Stats() if wants_stats(args) else None
+    if stats:
+        stats.instrument(dbi, paths)
+    _worker.update(args=args, paths=paths, dbi=dbi, marks=marks, stats=stats)
+
+
+def export_conversation(conversation_id, conversation_type):
+    """export one conversation into --out-dir
+
+    Returns id, messages written, seconds taken, output file, its new high-water mark
+    and with --stats what Stats.take measured."""
+    args, paths, dbi, marks, stats = (
+        _worker[k] for k in ("args", "paths", "dbi", "marks", "stats")
+    )
+    started = time.monotonic()
+    # one per conversation, so its copy threads are shut down before the task returns
+    paths.mirror = AttachmentMirror(
+        os.path.join(args.out_dir, "attachments"),
+        link_mode=args.link_mode,
+        check=args.mirror_check,
+        workers=args.copy_workers,
+        link_dir=args.out_dir,
+    )
+    handler_class = handlers[args.format]
+    file_name = f"{safe_file_name(conversation_id)}.{handler_class.extension}"
+    path = os.path.join(args.out_dir, file_name)
+    mark = marks.get(path, conversation_id) if marks else None
+    out, appending = open_export(path, handler_class.footer, mark is not None)
+    outputs = [(path, out.tell())]
+    try:
+        with out:
+            handler = handler_class(paths, out)
+            handler.inline_text_limit = args.inline_text_limit
+            if stats:
+                stats.instrument_handler(handler)
+            dbi.compact_lookup = conversation_type != "group"
+            query = build_query(args, conversation_id, mark if appending else None)
+            last = dbi.process_with_handler(query, handler, append=appending)
+    finally:
+        paths.mirror.finish(report=False)  # export_all prints its own summary
+    elapsed = time.monotonic() - started
+    measured = None
+    if stats:
+        stats.count("rows_rendered", handler.written)
+        stats.count_output(outputs)
+        stats.count_mirror(paths.mirror)
+        measured = stats.take()
+    return conversation_id, handler.written, elapsed, path, last, measured
+
+
+def export_all(args, paths):
+    dbi = DBI(paths, cache_dir=args.cache_dir)
+    try:
+        conversations = dbi.list_conversations()
+        directory = dbi.directory
+    finally:
+        dbi.close()
+    os.makedirs(args.out_dir, exist_ok=True)
+    marks = HighWaterMarks(args.incremental) if args.incremental else None
+    started = time.monotonic()
+    stats = Stats() if wants_stats(args) else None
+    summary = []
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_export_worker,
+        initargs=(args, paths.base, directory, marks),
+    ) as pool:
+        futures = [pool.submit(export_conversation, *conv) for conv in conversations]
+        for future in as_completed(futures):
+            cid, count, seconds, path, last, measured = future.result()
+            summary.append((cid, count, seconds))
+            if stats:
+                stats.merge(measured)
+            if marks and last:
+                marks.set(path, cid, last)
+                marks.save()
+    elapsed = time.monotonic() - started
+    summary.sort(key=lambda entry: entry[2], reverse=True)
+    lines = [
+        (cid, f"{count:>8} messages  {seconds:8.2f} s")
+        for cid, count, seconds in summary
+    ]
+    total = sum(entry[1] for entry in summary)
+    lines.append(("total", f"{total:>8} messages  {elapsed:8.2f} s"))
+    print("\n".join(justify1(lines)))
+    if stats:
+        report_stats(args, stats)
@@ -0,0 +1,80 @@
+"""ProcessSession against a fake sqlcipher shell that answers PRAGMA key with "ok" """
+
+import os, sys, stat, sqlite3, tempfile, textwrap, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from signal_export.db import ProcessSession
+
+# enough of the sqlite shell for ProcessSession: .mode, .explain, .print and
+# statements, with the "ok" row of PRAGMA key formatted like the real one
+fake_sqlcipher = textwrap.dedent("""\
+    #!{python}
+    import sys, json, sqlite3
+    conn = sqlite3.connect(sys.argv[-1])
+    mode, sql = "list", ""
+    for line in sys.stdin:
+        line = line.rstrip("\\n")
+        if not sql and line.startswith("."):
+            command, _, arg = line.partition(" ")
+            if command == ".mode":
+                mode = arg
+            elif command == ".print":
+                print(arg, flush=True)
+            continue
+        sql += line + "\\n"
+        if not sqlite3.complete_statement(sql):
+            continue
+        if sql.lstrip().upper().startswith("PRAGMA KEY"):
+            names, rows = ["ok"], [("ok",)]
+        else:
+            cursor = conn.execute(sql.strip().rstrip(";"))
+            names = [d[0] for d in cursor.description or ()]
+            rows = cursor.fetchall()
+        sql = ""
+        if mode == "json":
+            if rows:
+                print("[" + ",\\n".join(json.dumps(dict(zip(names, r))) for r in rows) + "]")
+        else:
+            for r in rows:
+                print("|".join("" if v is None else str(v) for v in r))
+        sys.stdout.flush()
+    """)
+
+
+class ProcessSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        bin_dir = os.path.join(self.tmp.name, "bin")
+        os.mkdir(bin_dir)
+        script = os.path.join(bin_dir, "sqlcipher")
+        with open(script, "w") as fh:
+            fh.write(fake_sqlcipher.format(python=sys.executable))
+        os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = bin_dir + os.pathsep + self.path
+        self.db = os.path.join(self.tmp.name, "db.sqlite")
+        conn = sqlite3.connect(self.db)
+        conn.execute("create table conversations(id text, name text)")
+        conn.execute("insert into conversations values ('c0', 'a|b'), ('c1', null)")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        self.tmp.cleanup()
+
+    def test_keyed_session_returns_rows(self):
+        session = ProcessSession(self.db, "00" * 32)
+        try:
+            rows = list(
+                session.iterate("select id, name from conversations order by id")
+            )
+            self.assertEqual(rows, [("c0", "a|b"), ("c1", None)])
+            self.assertEqual(list(session.iterate("pragma user_version")), [(0,)])
+        finally:
+            session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()